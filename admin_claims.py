@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """Admin Claims Management for RefLoop Bot"""
 
-import database as db
+import database_async as adb
 
 async def list_claims(update, context):
     """Show all pending claims with details"""
@@ -14,9 +14,9 @@ async def list_claims(update, context):
         return
     
     # Get all pending claims
-    with db.get_db_connection() as conn:
+    async with adb.get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
+        await cursor.execute("""
             SELECT 
                 c.id,
                 c.referred_user_id,
@@ -34,8 +34,8 @@ async def list_claims(update, context):
             WHERE c.status = 'pending'
             ORDER BY c.created_at ASC
         """)
-        pending_claims = cursor.fetchall()
-        cursor.close()
+        pending_claims = await cursor.fetchall()
+        await cursor.close()
     
     if not pending_claims:
         await update.message.reply_text("✅ No pending claims!")
@@ -89,23 +89,30 @@ async def view_screenshot(update, context):
         return
     
     # Get claim
-    claim = db.get_claim(claim_id)
+    claim = await adb.get_claim(claim_id)
     
     if not claim:
         await update.message.reply_text(f"❌ Claim {claim_id} not found.")
         return
     
     # Get link details
-    link = db.get_link_by_id(claim['link_id'])
+    link = await adb.get_link_by_id(claim['link_id']) if claim['link_id'] is not None else None
     
     # Send screenshot with details
+    if link:
+        link_details = (
+            f"🔗 Service: {link['service_name']}\n"
+            f"📂 Category: {link['category']}\n"
+            f"🌐 Link: {link['url']}\n"
+            f"📄 Description: {link['description']}\n\n"
+        )
+    else:
+        # Claims outlive their link once it is retired
+        link_details = "🔗 Link retired\n\n"
     caption = (
         f"📸 **Claim #{claim_id}**\n\n"
         f"👤 User: ID {claim['referred_user_id']}\n"
-        f"🔗 Service: {link['service_name']}\n"
-        f"📂 Category: {link['category']}\n"
-        f"🌐 Link: {link['url']}\n"
-        f"📄 Description: {link['description']}\n\n"
+        f"{link_details}"
         f"**Actions:**\n"
         f"`/approve {claim_id}` or `/reject {claim_id}`"
     )
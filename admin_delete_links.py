@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """Admin Delete Links Management for RefLoop Bot"""
 
-import database as db
+import database_async as adb
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 async def list_links_for_deletion(update, context):
@@ -15,9 +15,9 @@ async def list_links_for_deletion(update, context):
         return
     
     # Get all referral links
-    with db.get_db_connection() as conn:
+    async with adb.get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
+        await cursor.execute("""
             SELECT 
                 l.id,
                 l.referrer_user_id,
@@ -33,8 +33,8 @@ async def list_links_for_deletion(update, context):
             JOIN users u ON l.referrer_user_id = u.user_id
             ORDER BY l.id ASC
         """)
-        links = cursor.fetchall()
-        cursor.close()
+        links = await cursor.fetchall()
+        await cursor.close()
     
     if not links:
         await update.message.reply_text("📭 No referral links in database.")
@@ -108,32 +108,21 @@ async def handle_delete_link(update, context):
     link_id = int(query.data.split('_')[1])
     
     # Get link details before deletion
-    link = db.get_link_by_id(link_id)
+    link = await adb.get_link_by_id(link_id)
     
     if not link:
         await query.edit_message_text(f"❌ Link {link_id} not found (already deleted?).")
         return
     
-    # Check for associated claims
-    with db.get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM claims WHERE link_id = %s", (link_id,))
-        result = cursor.fetchone()
-        claims_count = result['count']
-        cursor.close()
-    
-    # Delete associated claims first (if any)
-    if claims_count > 0:
-        with db.get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM claims WHERE link_id = %s", (link_id,))
-            cursor.close()
+    # Delete the link; its claims stay on record, pending ones are rejected
+    rejected = await adb.retire_referral_link(link_id)
     
-    # Now delete the link
-    db.delete_referral_link(link_id)
+    if rejected is None:
+        await query.edit_message_text(f"❌ Link {link_id} not found (already deleted?).")
+        return
     
     # Send confirmation
-    warning = f"\n⚠️ Also deleted {claims_count} associated claim(s)." if claims_count > 0 else ""
+    warning = f"\n⚠️ Rejected {rejected} pending claim(s)." if rejected else ""
     
     await query.edit_message_text(
         f"✅ **Link Deleted Successfully!**\n\n"
@@ -149,4 +138,4 @@ async def handle_delete_link(update, context):
     # Log the deletion
     import logging
     logger = logging.getLogger(__name__)
-    logger.info(f"Admin {user_id} deleted link {link_id} ({link['service_name']}) with {claims_count} claims")
+    logger.info(f"Admin {user_id} deleted link {link_id} ({link['service_name']}), {rejected} pending claims rejected")
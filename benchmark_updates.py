@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Update processing benchmark for RefLoop Bot
+Feeds synthetic updates from several users through PTB's sequential
+processor and through PerUserUpdateProcessor, with handlers that wait
+like a database round trip, and reports throughput and whether each
+user's updates ran in order. A skewed case then has one user queue
+several slow updates ahead of single quick updates from other users and
+reports how long the others had to wait. No bot token or database
+needed.
+
+Usage:
+    python benchmark_updates.py
+    python benchmark_updates.py --updates 2000 --users 100 --latency 0.02 --concurrency 16
+"""
+
+import time
+import asyncio
+import argparse
+import random
+from types import SimpleNamespace
+
+from telegram.ext import SimpleUpdateProcessor
+
+from update_processor import PerUserUpdateProcessor
+
+async def run(processor, updates, latency):
+    """Process all updates the way Application does; returns (seconds, in_order)"""
+    seen = {}
+
+    async def handler(update):
+        # Simulated handler: a couple of awaits on the "database"
+        await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+        seen.setdefault(update.effective_user.id, []).append(update.seq)
+        await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+
+    await processor.initialize()
+    started = time.perf_counter()
+    # Application starts one task per update, in arrival order
+    tasks = [asyncio.create_task(processor.process_update(u, handler(u))) for u in updates]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await processor.shutdown()
+
+    in_order = all(seqs == sorted(seqs) for seqs in seen.values())
+    return elapsed, in_order
+
+async def run_skewed(processor, backlog, slow, fast, others):
+    """One user's slow backlog ahead of quick updates from other users
+
+    Returns the seconds until every other user's update was done.
+    """
+    finished = []
+
+    async def slow_handler(update):
+        await asyncio.sleep(slow)
+
+    async def fast_handler(update):
+        await asyncio.sleep(fast)
+        finished.append(time.perf_counter())
+
+    updates = [(make_update(i, 0), slow_handler) for i in range(backlog)]
+    updates += [(make_update(backlog + i, i + 1), fast_handler) for i in range(others)]
+
+    await processor.initialize()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(processor.process_update(u, handler(u))) for u, handler in updates]
+    await asyncio.gather(*tasks)
+    await processor.shutdown()
+    return max(finished) - started
+
+def make_update(seq, user_id):
+    return SimpleNamespace(seq=seq, update_id=seq, effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+
+def make_updates(count, users):
+    return [
+        make_update(i, random.randrange(users))
+        for i in range(count)
+    ]
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds per simulated DB call")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--backlog', type=int, default=20, help="slow updates from one user in the skewed case")
+    args = parser.parse_args()
+
+    random.seed(1)
+    updates = make_updates(args.updates, args.users)
+
+    print("RefLoop Bot Update Processing Benchmark")
+    print("=" * 50)
+    print(f"{args.updates} updates from {args.users} users, ~{2 * args.latency * 1000:.0f}ms per handler\n")
+
+    results = []
+    for name, processor in (
+        ("sequential (PTB default)", SimpleUpdateProcessor(1)),
+        (f"per-user, limit {args.concurrency}", PerUserUpdateProcessor(args.concurrency)),
+    ):
+        elapsed, in_order = await run(processor, updates, args.latency)
+        results.append(elapsed)
+        print(f"  {name:<28} {elapsed:7.2f}s  {args.updates / elapsed:8.1f} updates/s  "
+              f"per-user order: {'✅' if in_order else '❌'}")
+
+    print(f"\n  Speed-up: {results[0] / results[1]:.1f}x")
+
+    slow, fast = 0.25, 0.01
+    print(f"\nSkewed: one user queues {args.backlog} x {slow * 1000:.0f}ms updates, "
+          f"{args.users} others send one {fast * 1000:.0f}ms update each\n")
+    for name, processor in (
+        ("sequential (PTB default)", SimpleUpdateProcessor(1)),
+        (f"per-user, limit {args.concurrency}", PerUserUpdateProcessor(args.concurrency)),
+    ):
+        elapsed = await run_skewed(processor, args.backlog, slow, fast, args.users)
+        print(f"  {name:<28} others done after {elapsed:6.2f}s")
+
+if __name__ == '__main__':
+    asyncio.run(main())
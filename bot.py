@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 import os
+import asyncio
 import logging
 import sys
 import signal
 import time
+import hashlib
+from datetime import datetime, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Conflict
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,6 +20,14 @@ from telegram.ext import (
     filters
 )
 import database as db
+import database_async as adb
+from submission_store import SubmissionStore
+from outbound import outbound
+from outbox import outbox
+from keep_alive import KeepAlive
+from webserver import WebServer, WEBHOOK_PATH
+from update_processor import PerUserUpdateProcessor
+from leader import LeaderLock
 
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
@@ -23,6 +35,9 @@ load_dotenv(dotenv_path=env_path)
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_USER_IDS = [int(id.strip()) for id in os.getenv('ADMIN_USER_IDS', '').split(',') if id.strip()]
 
+# Links shown per browse page
+BROWSE_PAGE_SIZE = 10
+
 CATEGORIES = [
     "Games",
     "Crypto", 
@@ -37,6 +52,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Set by the watchdog when it runs several bot processes
+WORKER_ID = int(os.getenv('WORKER_ID', '0'))
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', '1'))
+
+# Submit-flow drafts, kept in memory and persisted write-behind
+# (read and written through when several webhook workers share the users,
+# see main)
+submissions = SubmissionStore()
+
 def get_user_data(context, user_id):
     if 'users' not in context.bot_data:
         context.bot_data['users'] = {}
@@ -58,7 +82,7 @@ async def start(update, context):
         return
     
     try:
-        db.create_user(user.id, user.username)
+        await adb.create_user(user.id, user.username)
         logger.info("User %d created/updated" % user.id)
     except Exception as e:
         logger.error("Failed to create user: %s" % str(e))
@@ -131,7 +155,7 @@ async def submit_link_start(update, context):
             await update.message.reply_text(msg)
         return
     
-    db.create_user(user.id, user.username)
+    await adb.create_user(user.id, user.username)
     
     await start_submission_flow(update, context, user)
 
@@ -165,7 +189,7 @@ async def submit_category(update, context):
     user_data['category'] = CATEGORIES[cat_index]
     user_data['state'] = 'SUBMIT_SERVICE'
     
-    db.save_submission_state(user_id, state='SUBMIT_SERVICE', category=CATEGORIES[cat_index])
+    await submissions.update(user_id, state='SUBMIT_SERVICE', category=CATEGORIES[cat_index])
     
     await query.edit_message_text(
         "Category: %s\n\n"
@@ -177,7 +201,7 @@ async def submit_category(update, context):
 async def submit_service(update, context):
     user_id = update.message.from_user.id
     
-    db.save_submission_state(user_id, state='SUBMIT_URL', service_name=update.message.text.strip())
+    await submissions.update(user_id, state='SUBMIT_URL', service_name=update.message.text.strip())
     
     await update.message.reply_text(
         "Service: %s\n\n"
@@ -195,7 +219,8 @@ async def submit_url(update, context):
         )
         return
     
-    db.save_submission_state(user_id, state='SUBMIT_DESCRIPTION', url=url)
+    # Persist now: the next step creates the link from this draft
+    await submissions.update(user_id, flush=True, state='SUBMIT_DESCRIPTION', url=url)
     
     await update.message.reply_text(
         "URL: %s\n\n"
@@ -207,7 +232,7 @@ async def submit_url(update, context):
 async def submit_description(update, context):
     user_id = update.message.from_user.id
     
-    submission_state = db.get_submission_state(user_id)
+    submission_state = await submissions.fetch(user_id)
     if not submission_state:
         await update.message.reply_text("Session expired. Please start again with /start")
         return
@@ -221,7 +246,7 @@ async def submit_description(update, context):
         )
         return
     
-    link_id = db.create_referral_link(
+    link_id = await adb.create_referral_link(
         user_id,
         submission_state['category'],
         submission_state['service_name'],
@@ -247,7 +272,7 @@ async def submit_description(update, context):
         )
     )
     
-    db.clear_submission_state(user_id)
+    await submissions.clear(user_id)
 
 async def browse_links_callback(update, context):
     try:
@@ -265,7 +290,7 @@ async def browse_links_callback(update, context):
                 await update.message.reply_text(msg)
             return
         
-        categories = db.get_categories()
+        categories = await adb.get_category_stats()
         
         if not categories:
             msg = "No referral links available yet.\n\nBe the first to submit one!"
@@ -275,8 +300,8 @@ async def browse_links_callback(update, context):
                 await update.message.reply_text(msg)
             return
         
-        keyboard = [[InlineKeyboardButton(cat, callback_data="browse_cat_%d" % i)] 
-                    for i, cat in enumerate(categories)]
+        keyboard = [[InlineKeyboardButton("%s (%d)" % (cat['category'], cat['live_links']), callback_data="browse_cat_%d" % cat['id'])] 
+                    for cat in categories]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         msg = "Browse Referral Links\n\nSelect a category:"
@@ -292,16 +317,61 @@ async def browse_links_callback(update, context):
         except:
             pass
 
+CURSOR_EPOCH = datetime(1970, 1, 1)
+
+def encode_page_cursor(link):
+    """Encode a link's (created_at, id) keyset position for callback data"""
+    micros = (link['created_at'] - CURSOR_EPOCH) // timedelta(microseconds=1)
+    return "%d_%d" % (micros, link['id'])
+
+def decode_page_cursor(micros, link_id):
+    """Decode a keyset position produced by encode_page_cursor"""
+    return (CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(link_id))
+
 async def browse_category(update, context):
     try:
         query = update.callback_query
         await query.answer()
         
-        categories = db.get_categories()
-        cat_index = int(query.data.split('_')[-1])
-        category = categories[cat_index]
+        # browse_cat_<category id> opens the first page,
+        # browse_pg_<category id>_<n|p>_<created_at>_<id> pages forward/backward
+        parts = query.data.split('_')
+        cursor = None
+        backward = False
+        if parts[1] == 'pg':
+            category_id = int(parts[2])
+            backward = parts[3] == 'p'
+            cursor = decode_page_cursor(parts[4], parts[5])
+        else:
+            category_id = int(parts[2])
         
-        links = db.get_available_links(category)
+        category = await adb.get_category_name(category_id)
+        if category is None:
+            await query.edit_message_text("This category no longer exists.")
+            return
+        
+        # Fetch one extra row to know whether another page exists
+        links = await adb.get_category_page(category, BROWSE_PAGE_SIZE + 1, cursor, backward)
+        
+        if cursor is None:
+            has_prev = False
+            has_next = len(links) > BROWSE_PAGE_SIZE
+            links = links[:BROWSE_PAGE_SIZE]
+        elif backward:
+            has_prev = len(links) > BROWSE_PAGE_SIZE
+            has_next = True
+            links = links[-BROWSE_PAGE_SIZE:]
+        else:
+            has_prev = True
+            has_next = len(links) > BROWSE_PAGE_SIZE
+            links = links[:BROWSE_PAGE_SIZE]
+        
+        if not links and cursor is not None:
+            # The page emptied since it was rendered, start over
+            links = await adb.get_category_page(category, BROWSE_PAGE_SIZE + 1)
+            has_prev = False
+            has_next = len(links) > BROWSE_PAGE_SIZE
+            links = links[:BROWSE_PAGE_SIZE]
         
         if not links:
             await query.edit_message_text(
@@ -313,9 +383,8 @@ async def browse_category(update, context):
         keyboard = []
         message = "Available Links in %s:\n\n" % category
         
-        for i, link in enumerate(links[:10]):
-            referrer = db.get_user_by_id(link['referrer_user_id'])
-            username = referrer['username'] if referrer else "Unknown"
+        for i, link in enumerate(links):
+            username = link['referrer_username'] or "Unknown"
             message += (
                 "%d. %s\n"
                 "%s\n"
@@ -328,6 +397,20 @@ async def browse_category(update, context):
             )
             keyboard.append([InlineKeyboardButton("Use %s" % link['service_name'], callback_data="use_link_%d" % link['id'])])
         
+        nav_row = []
+        if has_prev:
+            nav_row.append(InlineKeyboardButton(
+                "< Prev",
+                callback_data="browse_pg_%d_p_%s" % (category_id, encode_page_cursor(links[0]))
+            ))
+        if has_next:
+            nav_row.append(InlineKeyboardButton(
+                "Next >",
+                callback_data="browse_pg_%d_n_%s" % (category_id, encode_page_cursor(links[-1]))
+            ))
+        if nav_row:
+            keyboard.append(nav_row)
+        
         keyboard.append([InlineKeyboardButton("Back to Categories", callback_data="menu_browse")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -347,22 +430,35 @@ async def use_link(update, context):
         user_id = query.from_user.id
         link_id = int(query.data.split('_')[-1])
         
-        link = db.get_link_by_id(link_id)
+        def notifications(link):
+            # Written with the reservation and delivered by the outbox dispatcher
+            return [{
+                'chat_id': link['referrer_user_id'],
+                'text': "Great news!\n\n"
+                        "Someone used your referral link for %s!\n"
+                        "Used by: @%s\n\n"
+                        "Your link has been removed as planned.\n"
+                        "You can submit it again anytime!" % (
+                            link['service_name'],
+                            query.from_user.username
+                        )
+            }]
         
-        if not link:
-            await query.edit_message_text("This link is no longer available.")
-            return
+        outcome, link = await adb.reserve_link(link_id, user_id, notify=notifications)
         
-        if link['current_claims'] >= link['max_claims']:
-            await query.edit_message_text("This link has already been used.")
+        if outcome == adb.RESERVE_MISSING:
+            await query.edit_message_text("This link is no longer available.")
             return
         
-        if link['referrer_user_id'] == user_id:
+        if outcome == adb.RESERVE_OWN_LINK:
             await query.edit_message_text("You cannot use your own referral link!")
             return
         
-        db.increment_link_claims(link_id)
+        if outcome == adb.RESERVE_EXHAUSTED:
+            await query.edit_message_text("This link has already been used.")
+            return
         
+        outbox.wake()
         await query.edit_message_text(
             "Here's your referral link!\n\n"
             "Service: %s\n"
@@ -375,21 +471,6 @@ async def use_link(update, context):
                 link['url']
             )
         )
-        
-        try:
-            await context.bot.send_message(
-                chat_id=link['referrer_user_id'],
-                text="Great news!\n\n"
-                     "Someone used your referral link for %s!\n"
-                     "Used by: @%s\n\n"
-                     "Your link has been removed as planned.\n"
-                     "You can submit it again anytime!" % (
-                         link['service_name'],
-                         query.from_user.username
-                     )
-            )
-        except Exception as e:
-            logger.error("Failed to notify link owner: %s" % str(e))
     except Exception as e:
         logger.error("Error in use_link: %s" % str(e))
         try:
@@ -402,7 +483,7 @@ async def handle_text_input(update, context):
         return
     
     user_id = update.message.from_user.id
-    submission_state = db.get_submission_state(user_id)
+    submission_state = await submissions.fetch(user_id)
     
     if not submission_state:
         return
@@ -422,6 +503,7 @@ async def cancel_submission(update, context):
     user_id = query.from_user.id
     user_data = get_user_data(context, user_id)
     user_data.clear()
+    await submissions.clear(user_id)
     await query.edit_message_text("Submission cancelled.")
 
 async def admin_command(update, context):
@@ -459,9 +541,10 @@ async def admin_handler(update, context):
     
     if query.data == "admin_stats":
         try:
-            total_users = db.get_total_users()
-            total_links = db.get_total_links()
-            available_links = db.get_available_links_count()
+            counters = await adb.get_stats_counters()
+            total_users = counters.get('users')
+            total_links = counters.get('links')
+            available_links = counters.get('live_links')
             
             stats_msg = (
                 "BOT STATISTICS\n"
@@ -482,18 +565,258 @@ async def admin_handler(update, context):
     elif query.data == "admin_close":
         await query.edit_message_text("Admin menu closed.")
 
-def handle_signal(signum, frame):
-    logger.info("Received signal %d, shutting down gracefully..." % signum)
-    sys.exit(0)
+async def reconcile_stats_loop():
+    """Periodically correct drift in the trigger-maintained statistics"""
+    interval = float(os.getenv('STATS_RECONCILE_INTERVAL', '3600'))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            drift = await adb.reconcile_stats_counters()
+            if drift:
+                logger.warning("Stats counters drift corrected: %s" % drift)
+        except Exception as e:
+            logger.error("Stats reconciliation failed: %s" % str(e))
+
+async def metrics_loop():
+    """Periodically log this process's pool and outbound queue metrics"""
+    interval = float(os.getenv('METRICS_LOG_INTERVAL', '300'))
+    while True:
+        await asyncio.sleep(interval)
+        adb.log_pool_stats()
+        # Silent unless something reopened the sync pool
+        db.log_pool_stats()
+        outbound.log_stats()
+
+async def post_init(application):
+    """Open the async database pool and warm in-memory state"""
+    await adb.open_pool()
+    await submissions.start()
+    outbox.start(application.bot)
+    # Telegram's global limit is per bot, so workers split it
+    outbound.global_rate = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30')) / WORKER_COUNT
+    application.bot_data['metrics_task'] = asyncio.create_task(metrics_loop())
+    if WORKER_ID == 0:
+        application.bot_data['stats_task'] = asyncio.create_task(reconcile_stats_loop())
+
+async def shutdown(application):
+    """Finish in-flight work within SHUTDOWN_TIMEOUT seconds and release resources
+    
+    Call once intake has stopped. Handlers still running at the deadline
+    are cancelled and queued messages dropped; both are reported. Outbox
+    rows left undelivered stay in the table for the next instance.
+    """
+    started = time.monotonic()
+    deadline = started + float(os.getenv('SHUTDOWN_TIMEOUT', '25'))
+    remaining = lambda: max(0.0, deadline - time.monotonic())
+    abandoned_updates = 0
+    abandoned_messages = 0
+    flushed = 0
+    
+    if application.running:
+        processor = application.update_processor
+        queue = application.update_queue
+        if processor.pending() or queue.qsize():
+            logger.info("Waiting for %d in-flight update(s)..." % (processor.pending() + queue.qsize()))
+        while queue.qsize() and remaining():
+            await asyncio.sleep(0.05)
+        if not await processor.drain(remaining()) or queue.qsize():
+            # Updates still queued are skipped once they reach the processor
+            abandoned_updates = processor.abandon() + queue.qsize()
+            await processor.drain(1)
+        await application.stop()
+    
+    for name in ('stats_task', 'metrics_task'):
+        task = application.bot_data.pop(name, None)
+        if task:
+            task.cancel()
+    
+    try:
+        await outbox.stop(timeout=remaining())
+        abandoned_messages = await outbound.stop(timeout=remaining())
+    except Exception as e:
+        logger.error("Error stopping message delivery: %s" % str(e))
+    
+    # Always flush drafts, even past the deadline: it is one batched write
+    try:
+        flushed = await submissions.stop()
+    except Exception as e:
+        logger.error("Failed to flush submission drafts: %s" % str(e))
+    
+    await adb.close_pool()
+    db.close_pool()
+    await application.shutdown()
+    
+    logger.info(
+        "Shutdown finished in %.1fs: %d update(s) abandoned, %d message(s) abandoned, %d draft(s) flushed" % (
+            time.monotonic() - started, abandoned_updates, abandoned_messages, flushed
+        )
+    )
+
+async def run_webhook(application, webhook_url, stop_event):
+    """Serve updates pushed by Telegram through the embedded aiohttp server
+    
+    The same server answers /healthz and /readyz. PTB's run_webhook isn't
+    used since it can't serve extra routes, so the lifecycle is driven
+    here.
+    """
+    # Derived from the token by default so every worker agrees on it
+    secret = os.getenv('WEBHOOK_SECRET') or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+    server = WebServer(application, secret_token=secret)
+    keep_alive = None
+    
+    await application.initialize()
+    try:
+        await post_init(application)
+        await application.start()
+        # Workers share the port; the kernel spreads connections between them
+        await server.start('0.0.0.0', int(os.getenv('PORT', '8000')), reuse_port=WORKER_COUNT > 1)
+        if WORKER_ID == 0:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip('/') + WEBHOOK_PATH,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info("Webhook set to %s%s" % (webhook_url.rstrip('/'), WEBHOOK_PATH))
+        report_serving()
+        
+        render_url = os.getenv('RENDER_EXTERNAL_URL')
+        if render_url and WORKER_ID == 0:
+            # Keep the free-tier instance awake via the cheap liveness probe,
+            # only when no updates have arrived for a whole idle window
+            keep_alive = KeepAlive(render_url.rstrip('/') + '/healthz', last_activity=lambda: server.last_update_at)
+            await keep_alive.start()
+        
+        await stop_event.wait()
+    finally:
+        if keep_alive:
+            await keep_alive.stop()
+        # Refuse new updates (Telegram redelivers them later) while draining
+        server.stop_intake()
+        await shutdown(application)
+        await server.stop()
+    return True
+
+async def run_polling(application, stop_event):
+    """Poll for updates while holding the leader lock
+    
+    A second instance waits as a standby instead of fighting over
+    getUpdates. Returns False if leadership was lost while polling.
+    """
+    leader = LeaderLock()
+    try:
+        if not await leader.acquire(stop_event):
+            return True
+        
+        await application.initialize()
+        try:
+            await post_init(application)
+            await application.start()
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            logger.info("Polling for updates as leader")
+            report_serving()
+            stopped = await leader.hold(stop_event)
+        finally:
+            # Stop fetching first; unfetched updates stay with Telegram
+            if application.updater.running:
+                await application.updater.stop()
+            await shutdown(application)
+    finally:
+        await leader.release()
+    
+    if not stopped:
+        logger.error("Leadership lost - stopping so a leader can be re-elected")
+    return stopped
+
+def report_serving():
+    """Tell the watchdog updates are flowing (it times failovers with this)"""
+    if os.getenv('WATCHDOG_PROTOCOL'):
+        print("SERVING", flush=True)
+
+async def wait_for_promotion(application, stop_event):
+    """Warm up as a standby and wait for the watchdog's "GO <id>" line
+    
+    Imports, handler setup and migrations are already done by now; this
+    also opens the database pool and initialises the bot. Returns the
+    promotion id, or None if stopped (or the watchdog went away) first.
+    """
+    await adb.open_pool()
+    await application.initialize()
+    
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    print("READY", flush=True)
+    logger.info("Warm standby ready, waiting for promotion")
+    
+    line = asyncio.create_task(reader.readline())
+    stopped = asyncio.create_task(stop_event.wait())
+    await asyncio.wait({line, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    stopped.cancel()
+    if line.done():
+        command = line.result().decode().split()
+        if command[:1] == ['GO']:
+            return command[1] if len(command) > 1 else '0'
+    else:
+        line.cancel()
+    
+    await application.shutdown()
+    await adb.close_pool()
+    db.close_pool()
+    return None
+
+async def heartbeat_loop(path, interval):
+    """Touch the watchdog's heartbeat file while the event loop is responsive"""
+    while True:
+        try:
+            with open(path, 'w') as f:
+                f.write("%.0f\n" % time.time())
+        except OSError as e:
+            logger.warning("Heartbeat write failed: %s" % str(e))
+        await asyncio.sleep(interval)
+
+async def serve(application, webhook_url=None):
+    """Run until SIGTERM/SIGINT; returns False if the bot should restart"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    
+    def handle_signal(signum):
+        logger.info("Received signal %d, shutting down gracefully..." % signum)
+        stop_event.set()
+    
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, handle_signal, signum)
+    
+    if os.getenv('BOT_STANDBY'):
+        started = time.monotonic()
+        promotion = await wait_for_promotion(application, stop_event)
+        if promotion is None:
+            return True
+        logger.info("Promoted from warm standby (#%s, %.1fs after start)" % (promotion, time.monotonic() - started))
+    
+    # Liveness for the watchdog; runs while leading and while on standby
+    heartbeat = None
+    heartbeat_file = os.getenv('HEARTBEAT_FILE')
+    if heartbeat_file:
+        heartbeat = asyncio.create_task(
+            heartbeat_loop(heartbeat_file, float(os.getenv('HEARTBEAT_INTERVAL', '5')))
+        )
+    
+    try:
+        if webhook_url:
+            return await run_webhook(application, webhook_url, stop_event)
+        return await run_polling(application, stop_event)
+    finally:
+        if heartbeat:
+            heartbeat.cancel()
 
 async def error_handler(update, context):
     """Handle errors in the bot"""
     logger.error("Update %s caused error %s" % (update, context.error))
     
-    # If it's a Conflict error, exit to let watchdog restart
-    if "Conflict" in str(context.error):
-        logger.error("Conflict detected - exiting for watchdog restart")
-        sys.exit(1)
+    # Leader election keeps our own instances apart; a Conflict means
+    # something else is polling with this token. PTB keeps retrying.
+    if isinstance(context.error, Conflict):
+        logger.warning("Conflict: another getUpdates consumer is using this bot token")
 
 def main():
     if not BOT_TOKEN:
@@ -503,17 +826,24 @@ def main():
     
     logger.info("BOT_TOKEN found: %s..." % BOT_TOKEN[:20])
     
-    signal.signal(signal.SIGTERM, handle_signal)
-    signal.signal(signal.SIGINT, handle_signal)
+    webhook_url = os.getenv('WEBHOOK_URL')
+    # Webhook workers split a user's updates between them, so drafts must
+    # live in the database. Polling workers don't: only the leader handles
+    # updates, and a new leader loads the drafts its predecessor flushed.
+    submissions.shared = bool(webhook_url) and WORKER_COUNT > 1
     
     logger.info("Creating application...")
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(int(os.getenv('UPDATE_CONCURRENCY', '16'))))
+    )
+    if webhook_url:
+        # Updates arrive through our own aiohttp server
+        builder.updater(None)
+    application = builder.build()
     logger.info("Application created")
     
-    # Add a small delay to allow old instance to shut down
-    import time
-    time.sleep(2)
-    
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("admin", admin_command))
     application.add_handler(CommandHandler("submit_link", submit_link_start))
@@ -521,7 +851,7 @@ def main():
     application.add_handler(CallbackQueryHandler(menu_handler, pattern="^menu_"))
     application.add_handler(CallbackQueryHandler(submit_category, pattern="^cat_"))
     application.add_handler(CallbackQueryHandler(cancel_submission, pattern="^submit_cancel$"))
-    application.add_handler(CallbackQueryHandler(browse_category, pattern="^browse_cat_"))
+    application.add_handler(CallbackQueryHandler(browse_category, pattern="^browse_(cat|pg)_"))
     application.add_handler(CallbackQueryHandler(use_link, pattern="^use_link_"))
     application.add_handler(CallbackQueryHandler(admin_handler, pattern="^admin_"))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
@@ -535,19 +865,21 @@ def main():
     except Exception as e:
         logger.error("Database initialization failed: %s" % str(e))
         return
+    finally:
+        # Handlers only use the async pool; don't keep idle sync
+        # connections open for the life of the process
+        db.close_pool()
     
     logger.info("All handlers registered")
-    logger.info("Starting polling mode for maximum reliability")
     logger.info("Watchdog monitoring active - bot will auto-restart on crash")
     
+    logger.info("Starting %s mode" % ('webhook' if webhook_url else 'polling'))
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
-    except KeyboardInterrupt:
-        logger.info("Bot interrupted by user")
-        sys.exit(0)
+        clean = asyncio.run(serve(application, webhook_url))
     except Exception as e:
-        logger.error("Polling error: %s" % str(e), exc_info=True)
+        logger.error("Bot error: %s" % str(e), exc_info=True)
         sys.exit(1)
+    sys.exit(0 if clean else 1)
 
 if __name__ == '__main__':
     main()
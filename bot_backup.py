@@ -845,45 +845,30 @@ async def approve_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Invalid claim ID.")
         return
     
-    claim = db.get_claim(claim_id)
-    
-    if not claim:
+    # Approve and apply counters/auto-delete in a single transaction
+    result = db.approve_claim_atomic(claim_id)
+    claim = result['claim']
+    link_update = result['link']
+    total_claims = result['total_claims']
+    link_deleted = result['link_deleted']
+    
+    if result['outcome'] == db.APPROVE_MISSING:
         await update.message.reply_text("❌ Claim not found.")
         return
     
-    if claim['status'] != 'pending':
+    if result['outcome'] == db.APPROVE_NOT_PENDING:
         await update.message.reply_text(f"❌ Claim is already {claim['status']}.")
         return
     
-    # Verify the linked referral still exists
-    link = db.get_link_by_id(claim['link_id'])
-    if not link:
+    if result['outcome'] == db.APPROVE_LINK_MISSING:
         await update.message.reply_text("❌ The referral link no longer exists.")
-        db.reject_claim(claim_id)
         return
     
-    # Safety check: ensure link hasn't reached max claims
-    if link['current_claims'] >= link['max_claims']:
+    if result['outcome'] == db.APPROVE_LINK_FULL:
         await update.message.reply_text("❌ This link has already reached its maximum claims.")
-        db.reject_claim(claim_id)
         return
     
-    # Approve the claim
-    db.approve_claim(claim_id)
-    
-    # Update user's verified claims count
-    total_claims = db.update_user_claims(claim['referred_user_id'])
-    
-    # Increment link's current claims and get updated values
-    link_update = db.increment_link_claims(claim['link_id'])
-    
-    # Check if link reached its limit and delete if so
-    link_deleted = False
-    if link_update and link_update['current_claims'] >= link_update['max_claims']:
-        # Link reached limit - delete it
-        db.delete_referral_link(claim['link_id'])
-        link_deleted = True
-        
+    if link_deleted:
         # Notify the referrer
         try:
             await context.bot.send_message(
@@ -979,8 +964,10 @@ async def reject_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Claim is already {claim['status']}.")
         return
     
-    # Reject the claim
-    db.reject_claim(claim_id)
+    # Reject the claim (unless an approval got there first)
+    if not db.reject_claim(claim_id):
+        await update.message.reply_text("❌ Claim is no longer pending.")
+        return
     
     # Notify user
     try:
@@ -1169,7 +1156,7 @@ def main():
         async def post_init(app: Application):
             """Initialize keep-alive after application starts"""
             keep_alive = KeepAlive(webhook_url, interval=840)
-            keep_alive.start()
+            await keep_alive.start()
             logger.info("🔄 Keep-alive system activated (pinging root URL)")
         
         application.post_init = post_init
@@ -1169,7 +1169,7 @@ def main():
         async def post_init(app: Application):
             """Initialize keep-alive after application starts"""
             keep_alive = KeepAlive(webhook_url, interval=840)
-            keep_alive.start()
+            await keep_alive.start()
             logger.info("🔄 Keep-alive system activated (pinging root URL)")
         
         application.post_init = post_init
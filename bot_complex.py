@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import os
+import asyncio
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
@@ -15,11 +16,14 @@ from telegram.ext import (
     filters
 )
 import database as db
+import database_async as adb
 import admin_dashboard
 import admin_claims
 import admin_delete_links
 import admin_menu
 from keep_alive import KeepAlive
+from outbound import outbound
+from outbox import outbox
 
 # Load environment variables from .env file
 env_path = Path(__file__).parent / '.env'
@@ -638,6 +642,20 @@ async def claim_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
+async def notify_admins(bot, photo: str, caption: str):
+    """Send a claim alert to every admin concurrently
+    
+    The outbound queue paces the actual sends; a failure for one admin
+    doesn't affect the others.
+    """
+    async def notify(admin_id):
+        try:
+            await outbound.send_photo(bot, chat_id=admin_id, photo=photo, caption=caption)
+        except Exception as e:
+            logger.error(f"Failed to notify admin {admin_id}: {e}")
+    
+    await asyncio.gather(*(notify(admin_id) for admin_id in ADMIN_USER_IDS))
+
 async def claim_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle screenshot submission"""
     user_id = update.effective_user.id
@@ -665,7 +683,7 @@ async def claim_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         screenshot_file_id
     )
     
-    # Notify admins
+    # Build the admin alert
     link = db.get_link_by_id(link_id)
     admin_message = (
         f"🔔 New Claim Pending Review\n\n"
@@ -676,22 +694,19 @@ async def claim_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Use /approve {claim_id} or /reject {claim_id}"
     )
     
-    for admin_id in ADMIN_USER_IDS:
-        try:
-            await context.bot.send_photo(
-                chat_id=admin_id,
-                photo=screenshot_file_id,
-                caption=admin_message
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id}: {e}")
-    
+    # Acknowledge first; admin alerts go out in the background
     await update.message.reply_text(
         f"✅ Claim submitted! (ID: {claim_id})\n\n"
         "⏳ Your claim is pending admin review.\n"
         "You'll be notified once it's approved!"
     )
     
+    context.application.create_task(
+        notify_admins(context.bot, screenshot_file_id, admin_message),
+        update=update,
+        name=f"claim_{claim_id}_admin_alerts"
+    )
+    
     user_data.clear()
 
 async def test_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -762,57 +777,48 @@ async def approve_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Invalid claim ID. Please provide a number.")
         return
     
-    # Get claim details
-    claim = db.get_claim_by_id(claim_id)
-    if not claim:
+    def notifications(result):
+        # Queued in the approval transaction, delivered by the outbox dispatcher
+        claim = result['claim']
+        verified_claims = result['total_claims']
+        messages = []
+        if result['free_submission_granted']:
+            # Notify user about milestone
+            messages.append({
+                'chat_id': claim['referred_user_id'],
+                'text': f"🎉 **Milestone Reached!**\n\n"
+                        f"You've completed {verified_claims} verified claims!\n"
+                        f"🎁 You've unlocked 1 FREE submission (5 referrals)\n\n"
+                        f"Use the Submit Link button to use your free submission!"
+            })
+        # Notify user about approval
+        messages.append({
+            'chat_id': claim['referred_user_id'],
+            'text': f"✅ Your claim has been approved!\n\n"
+                    f"🎁 You earned 3 ⭐ Telegram Stars!\n"
+                    f"📊 Total verified claims: {verified_claims}\n\n"
+                    f"Keep claiming to unlock free submissions!"
+        })
+        return messages
+    
+    # Approve and apply counters/auto-delete in a single transaction
+    # (every 3 verified claims = 1 free submission)
+    result = db.approve_claim_atomic(claim_id, notify=notifications, free_every_third=True)
+    claim = result['claim']
+    
+    if result['outcome'] == db.APPROVE_MISSING:
         await update.message.reply_text(f"❌ Claim {claim_id} not found.")
         return
     
-    if claim['status'] != 'pending':
+    if result['outcome'] == db.APPROVE_NOT_PENDING:
         await update.message.reply_text(f"❌ Claim {claim_id} is already {claim['status']}.")
         return
     
-    # Approve the claim
-    db.approve_claim(claim_id)
-    
-    # Update link claims count
-    db.increment_link_claims(claim['link_id'])
-    
-    # Update user's verified claims count
-    db.increment_user_verified_claims(claim['referred_user_id'])
-    
-    # Check if user reached milestone (every 3 claims = 1 free submission)
-    user_data = db.get_user(claim['referred_user_id'])
-    verified_claims = user_data['total_verified_claims']
-    
-    if verified_claims % 3 == 0:
-        # Grant free submission
-        db.add_free_submission(claim['referred_user_id'])
-        
-        # Notify user about milestone
-        try:
-            await context.bot.send_message(
-                chat_id=claim['referred_user_id'],
-                text=f"🎉 **Milestone Reached!**\n\n"
-                     f"You've completed {verified_claims} verified claims!\n"
-                     f"🎁 You've unlocked 1 FREE submission (5 referrals)\n\n"
-                     f"Use the Submit Link button to use your free submission!"
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify user {claim['referred_user_id']}: {e}")
-    
-    # Notify user about approval
-    try:
-        await context.bot.send_message(
-            chat_id=claim['referred_user_id'],
-            text=f"✅ Your claim has been approved!\n\n"
-                 f"🎁 You earned 3 ⭐ Telegram Stars!\n"
-                 f"📊 Total verified claims: {verified_claims}\n\n"
-                 f"Keep claiming to unlock free submissions!"
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify user {claim['referred_user_id']}: {e}")
+    if result['outcome'] in (db.APPROVE_LINK_MISSING, db.APPROVE_LINK_FULL):
+        await update.message.reply_text(f"❌ Claim {claim_id} rejected: the link is no longer available.")
+        return
     
+    outbox.wake()
     await update.message.reply_text(f"✅ Claim {claim_id} approved.")
 
 async def reject_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -832,7 +838,7 @@ async def reject_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Get claim details
-    claim = db.get_claim_by_id(claim_id)
+    claim = db.get_claim(claim_id)
     if not claim:
         await update.message.reply_text(f"❌ Claim {claim_id} not found.")
         return
@@ -841,19 +847,17 @@ async def reject_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Claim {claim_id} is already {claim['status']}.")
         return
     
-    # Reject the claim
-    db.reject_claim(claim_id)
-    
-    # Notify user about rejection
-    try:
-        await context.bot.send_message(
-            chat_id=claim['referred_user_id'],
-            text=f"❌ Your claim has been rejected.\n\n"
-                 f"Please make sure to follow the instructions correctly and submit valid proof.\n\n"
-                 f"You can try claiming other referral links!"
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify user {claim['referred_user_id']}: {e}")
+    # Reject the claim and queue the user's notice in the same transaction
+    rejected = db.reject_claim(claim_id, notify=lambda claim: [{
+        'chat_id': claim['referred_user_id'],
+        'text': f"❌ Your claim has been rejected.\n\n"
+                f"Please make sure to follow the instructions correctly and submit valid proof.\n\n"
+                f"You can try claiming other referral links!"
+    }])
+    if not rejected:
+        await update.message.reply_text(f"❌ Claim {claim_id} is no longer pending.")
+        return
+    outbox.wake()
     
     await update.message.reply_text(f"✅ Claim {claim_id} rejected.")
 
@@ -895,6 +899,18 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif state == 'SUBMIT_DESCRIPTION':
         await submit_description(update, context)
 
+async def post_init(application):
+    """Open the async pool and start delivering queued notifications"""
+    await adb.open_pool()
+    outbox.start(application.bot)
+
+async def post_shutdown(application):
+    """Stop notification delivery and release database connections"""
+    await outbox.stop()
+    await outbound.stop(timeout=float(os.getenv('OUTBOUND_DRAIN_TIMEOUT', '10')))
+    await adb.close_pool()
+    db.close_pool()
+
 def main():
     """Main function to run the bot"""
     if not BOT_TOKEN:
@@ -902,7 +918,13 @@ def main():
         return
     
     # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Command handlers
     application.add_handler(CommandHandler("start", start))
@@ -1,8 +1,18 @@
 import os
-import psycopg
+import time
+import atexit
+import logging
+import threading
 from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
 from contextlib import contextmanager
 
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
 def get_database_url():
     """Get DATABASE_URL from environment"""
     url = os.getenv('DATABASE_URL')
@@ -10,98 +20,274 @@ def get_database_url():
         raise ValueError("DATABASE_URL environment variable is not set")
     return url
 
+def get_pool_settings():
+    """Get connection pool settings from environment
+
+    Read lazily so values from .env (loaded after import) are honoured.
+    """
+    return {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    }
+
+def get_pool():
+    """Get the process-wide connection pool, opening it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_pool_settings()
+                pool = ConnectionPool(
+                    get_database_url(),
+                    kwargs={'row_factory': dict_row},
+                    check=ConnectionPool.check_connection,
+                    name='refloop',
+                    open=False,
+                    **settings
+                )
+                pool.open()
+                logger.info("Database pool opened (min=%d, max=%d)" % (settings['min_size'], settings['max_size']))
+                _pool = pool
+    return _pool
+
+def close_pool():
+    """Close the connection pool (safe to call more than once)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+atexit.register(close_pool)
+
+def get_pool_stats():
+    """Get pool usage counters (size, waiting requests, wait time, errors)"""
+    if _pool is None:
+        return {}
+    return _pool.get_stats()
+
+def format_pool_stats(stats):
+    """One-line summary of a pool's pop_stats() wait metrics"""
+    requests = stats.get('requests_num', 0)
+    wait_ms = stats.get('requests_wait_ms', 0)
+    return "size=%d available=%d waiting=%d requests=%d queued=%d avg_wait=%.1fms errors=%d" % (
+        stats.get('pool_size', 0),
+        stats.get('pool_available', 0),
+        stats.get('requests_waiting', 0),
+        requests,
+        stats.get('requests_queued', 0),
+        (wait_ms / requests) if requests else 0.0,
+        stats.get('requests_errors', 0)
+    )
+
+def log_pool_stats():
+    """Log and reset the pool wait metrics collected since the last call"""
+    if _pool is None:
+        return
+    logger.info("DB pool: %s" % format_pool_stats(_pool.pop_stats()))
+
+class CategoryCache:
+    """In-process cache of categories with their live link counts
+
+    Filled on first read and invalidated by the helpers that change the
+    catalog, so category navigation costs no query in the steady state.
+    A TTL (CATEGORY_CACHE_TTL seconds) bounds staleness when other
+    processes write to the database. Category IDs never change, so the
+    id -> name map survives invalidation.
+    """
+    
+    def __init__(self):
+        self._names_by_id = {}
+        self._entries = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+    
+    def get(self):
+        """Cached rows (id, category, links, live_links) or None if stale"""
+        entries = self._entries
+        ttl = float(os.getenv('CATEGORY_CACHE_TTL', '300'))
+        if entries is None or time.monotonic() - self._loaded_at > ttl:
+            return None
+        return entries
+    
+    def generation(self):
+        """Token to pass to set() so a load racing a write is discarded"""
+        return self._generation
+    
+    def set(self, entries, generation):
+        with self._lock:
+            self._names_by_id.update((row['id'], row['category']) for row in entries)
+            if generation == self._generation:
+                self._entries = entries
+                self._loaded_at = time.monotonic()
+    
+    def name(self, category_id: int):
+        """Category name for a stable ID, or None if not loaded yet"""
+        return self._names_by_id.get(category_id)
+    
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries = None
+
+category_cache = CategoryCache()
+
+# Loads the rows held by category_cache
+CATEGORY_STATS_QUERY = """
+    SELECT
+        c.id,
+        c.name AS category,
+        COUNT(l.id) AS links,
+        COUNT(l.id) FILTER (WHERE l.current_claims < l.max_claims) AS live_links
+    FROM categories c
+    LEFT JOIN referral_links l ON l.category = c.name
+    GROUP BY c.id, c.name
+    ORDER BY c.name
+"""
+
+# Registers a link's category before the link is inserted
+REGISTER_CATEGORY_QUERY = """
+    INSERT INTO categories (name) VALUES (%s)
+    ON CONFLICT (name) DO NOTHING
+"""
+
+# Actual value of every statistic kept in stats_counters by database
+# triggers (migration 0004), recomputed from the tables
+STATS_ACTUAL_QUERY = """
+    SELECT actual.name, actual.value
+    FROM
+        (SELECT COUNT(*) AS users FROM users) u,
+        (
+            SELECT
+                COUNT(*) AS links,
+                COUNT(*) FILTER (WHERE current_claims < max_claims) AS live_links,
+                COALESCE(SUM(refloop_link_stars(max_claims)), 0) AS stars_received
+            FROM referral_links
+        ) l,
+        (
+            SELECT
+                COUNT(*) AS claims,
+                COUNT(*) FILTER (WHERE status = 'pending') AS claims_pending,
+                COUNT(*) FILTER (WHERE status = 'approved') AS claims_approved,
+                COUNT(*) FILTER (WHERE status = 'rejected') AS claims_rejected
+            FROM claims
+        ) c,
+        LATERAL (VALUES
+            ('users', u.users),
+            ('links', l.links),
+            ('live_links', l.live_links),
+            ('stars_received', l.stars_received),
+            ('claims', c.claims),
+            ('claims_pending', c.claims_pending),
+            ('claims_approved', c.claims_approved),
+            ('claims_rejected', c.claims_rejected)
+        ) AS actual(name, value)
+"""
+
+# Applies a drift correction as a delta, so it commutes with the
+# triggers' concurrent updates
+STATS_ADJUST_QUERY = """
+    INSERT INTO stats_counters (name, value, updated_at)
+    VALUES (%s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE SET
+        value = stats_counters.value + EXCLUDED.value,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Queues a notification for the outbox dispatcher (migration 0005)
+OUTBOX_INSERT_QUERY = """
+    INSERT INTO outbox (chat_id, method, payload)
+    VALUES (%s, %s, %s)
+"""
+
+def outbox_rows(messages):
+    """Parameters for OUTBOX_INSERT_QUERY
+
+    Each message is a dict with 'chat_id', an optional 'method' (default
+    send_message) and the remaining Bot API keyword arguments.
+    """
+    rows = []
+    for message in messages:
+        payload = dict(message)
+        chat_id = payload.pop('chat_id')
+        method = payload.pop('method', 'send_message')
+        rows.append((chat_id, method, Jsonb(payload)))
+    return rows
+
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections"""
-    conn = psycopg.connect(get_database_url(), row_factory=dict_row)
-    try:
+    """Context manager for pooled database connections
+
+    Commits on success and rolls back on error, then returns the
+    connection to the pool (health-checked again on next checkout).
+    """
+    with get_pool().connection() as conn:
         yield conn
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
 
 def init_database():
-    """Initialize database tables"""
+    """Bring the database schema up to date and check the hot queries' indexes
+
+    Costs a single query when the schema is already current, plus the
+    index check: a few EXPLAINs, which plan but don't run the queries.
+    """
+    import migrations
+    
+    if migrations.is_current():
+        print("Database schema is up to date")
+    else:
+        migrations.migrate()
+        print("Database initialized successfully!")
+    verify_index_usage()
+
+# Representative hot queries and the index each one should use
+INDEX_CHECK_QUERIES = {
+    'idx_referral_links_live_category': """
+        SELECT id FROM referral_links
+        WHERE category = 'Games' AND current_claims < max_claims
+        ORDER BY created_at DESC, id DESC
+        LIMIT 11
+    """,
+    'idx_claims_status_created': """
+        SELECT id FROM claims
+        WHERE status = 'pending'
+        ORDER BY created_at ASC
+    """,
+    'idx_claims_link_id': "SELECT COUNT(*) FROM claims WHERE link_id = 0",
+}
+
+def _plan_index_names(plan):
+    """Collect index names referenced anywhere in an EXPLAIN JSON plan"""
+    names = set()
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names |= _plan_index_names(child)
+    return names
+
+def verify_index_usage():
+    """Check with EXPLAIN that the hot queries can use their indexes
+
+    Sequential scans are disabled for the check so small tables, where
+    the planner would rightly prefer a seq scan, still report whether
+    the index is usable. Returns a dict of index name -> bool.
+    """
+    results = {}
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                username VARCHAR(255) NOT NULL,
-                free_submissions_available INTEGER DEFAULT 0,
-                total_verified_claims INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Referral links table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS referral_links (
-                id SERIAL PRIMARY KEY,
-                referrer_user_id BIGINT NOT NULL,
-                category TEXT NOT NULL,
-                service_name TEXT NOT NULL,
-                url TEXT NOT NULL,
-                description TEXT,
-                max_claims INTEGER NOT NULL,
-                current_claims INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (referrer_user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Migrate old column name if exists
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF EXISTS (
-                    SELECT 1 FROM information_schema.columns 
-                    WHERE table_name='referral_links' AND column_name='used_claims'
-                ) THEN
-                    ALTER TABLE referral_links RENAME COLUMN used_claims TO current_claims;
-                END IF;
-            END $$;
-        """)
-        
-        # Claims table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS claims (
-                id SERIAL PRIMARY KEY,
-                referred_user_id BIGINT NOT NULL,
-                link_id INTEGER NOT NULL,
-                screenshot_file_id VARCHAR(255) NOT NULL,
-                status VARCHAR(50) DEFAULT 'pending',
-                rewarded BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (referred_user_id) REFERENCES users(user_id),
-                FOREIGN KEY (link_id) REFERENCES referral_links(id),
-                UNIQUE(referred_user_id, link_id)
-            )
-        """)
-        
-        # Temporary submission state table (for webhook persistence)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS submission_state (
-                user_id BIGINT PRIMARY KEY,
-                state VARCHAR(50),
-                plan VARCHAR(10),
-                category TEXT,
-                service_name TEXT,
-                url TEXT,
-                description TEXT,
-                max_claims INTEGER,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            )
-        """)
-        
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, query in INDEX_CHECK_QUERIES.items():
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query)
+            plan = cursor.fetchone()['QUERY PLAN'][0]['Plan']
+            results[name] = name in _plan_index_names(plan)
+            if not results[name]:
+                logger.warning("Hot query is not using index %s" % name)
         cursor.close()
-        print("Database initialized successfully!")
+        conn.rollback()
+    return results
 
 # User operations
 def create_user(user_id: int, username: str):
@@ -168,6 +354,7 @@ def create_referral_link(referrer_user_id: int, category: str, service_name: str
     """Create a new referral link with specified max claims"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute(REGISTER_CATEGORY_QUERY, (category,))
         cursor.execute("""
             INSERT INTO referral_links (referrer_user_id, category, service_name, url, description, max_claims, current_claims)
             VALUES (%s, %s, %s, %s, %s, %s, 0)
@@ -176,7 +363,8 @@ def create_referral_link(referrer_user_id: int, category: str, service_name: str
         result = cursor.fetchone()
         link_id = result['id']
         cursor.close()
-        return link_id
+    category_cache.invalidate()
+    return link_id
 
 def get_available_links(category: str = None):
     """Get available referral links (not maxed out)"""
@@ -219,7 +407,8 @@ def increment_link_claims(link_id: int):
         """, (link_id,))
         result = cursor.fetchone()
         cursor.close()
-        return result
+    category_cache.invalidate()
+    return result
 
 def delete_referral_link(link_id: int):
     """Delete a referral link that has reached its limit"""
@@ -230,15 +419,41 @@ def delete_referral_link(link_id: int):
             WHERE id = %s
         """, (link_id,))
         cursor.close()
+    category_cache.invalidate()
 
-def get_categories():
-    """Get all unique categories"""
+def load_category_stats():
+    """Query all categories with link counts and refresh the cache"""
+    generation = category_cache.generation()
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT category FROM referral_links ORDER BY category")
-        categories = [row['category'] for row in cursor.fetchall()]
+        cursor.execute(CATEGORY_STATS_QUERY)
+        entries = cursor.fetchall()
         cursor.close()
-        return categories
+    category_cache.set(entries, generation)
+    return entries
+
+def get_category_stats():
+    """Get categories that have links, with total and live counts (cached)"""
+    entries = category_cache.get()
+    if entries is None:
+        entries = load_category_stats()
+    return [row for row in entries if row['links']]
+
+def get_category_name(category_id: int):
+    """Resolve a stable category ID to its name, from memory when possible"""
+    name = category_cache.name(category_id)
+    if name is None:
+        load_category_stats()
+        name = category_cache.name(category_id)
+    return name
+
+def get_categories():
+    """Get all unique categories"""
+    return [row['category'] for row in get_category_stats()]
+
+def get_category_counts():
+    """Get number of available links per category"""
+    return {row['category']: row['live_links'] for row in get_category_stats()}
 
 # Claim operations
 def create_claim(referred_user_id: int, link_id: int, screenshot_file_id: str):
@@ -275,6 +490,116 @@ def approve_claim(claim_id: int):
         """, (claim_id,))
         cursor.close()
 
+# Outcomes of approve_claim_atomic()
+APPROVE_APPROVED = 'approved'
+APPROVE_MISSING = 'missing'
+APPROVE_NOT_PENDING = 'not_pending'
+APPROVE_LINK_MISSING = 'link_missing'
+APPROVE_LINK_FULL = 'link_full'
+
+def approve_claim_atomic(claim_id: int, notify=None, free_every_third: bool = False):
+    """Approve a claim and apply all its effects in one transaction
+
+    Locks the claim and its link, approves the claim, bumps the user's
+    verified claims (granting a free submission on the 3rd, or on every
+    3rd with free_every_third), bumps the link's claims and deletes the
+    link once it reaches its limit. The link's claims are kept (their
+    link_id is set to NULL, migration 0006); any still pending are
+    rejected. A claim whose link is gone or already full is rejected
+    instead.
+
+    notify, if given, is called with the result of an approval and
+    returns outbox messages to queue in the same transaction.
+
+    Returns a dict with 'outcome' (one of the APPROVE_* constants),
+    'claim', 'link', 'total_claims', 'free_submission_granted' and
+    'link_deleted'.
+    """
+    result = {
+        'outcome': None,
+        'claim': None,
+        'link': None,
+        'total_claims': None,
+        'free_submission_granted': False,
+        'link_deleted': False,
+    }
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # Lock the link before the claim: retiring a full link updates its
+        # other claims, so every approval must take the locks in this order
+        link = None
+        cursor.execute("SELECT link_id FROM claims WHERE id = %s", (claim_id,))
+        row = cursor.fetchone()
+        if row and row['link_id'] is not None:
+            cursor.execute("SELECT * FROM referral_links WHERE id = %s FOR UPDATE", (row['link_id'],))
+            link = cursor.fetchone()
+        
+        cursor.execute("SELECT * FROM claims WHERE id = %s FOR UPDATE", (claim_id,))
+        claim = cursor.fetchone()
+        result['claim'] = claim
+        
+        if not claim:
+            result['outcome'] = APPROVE_MISSING
+            cursor.close()
+            return result
+        
+        if claim['status'] != 'pending':
+            result['outcome'] = APPROVE_NOT_PENDING
+            cursor.close()
+            return result
+        
+        if link and claim['link_id'] != link['id']:
+            # The link was retired (link_id set to NULL) before our lock
+            link = None
+        result['link'] = link
+        
+        if not link or link['current_claims'] >= link['max_claims']:
+            cursor.execute("UPDATE claims SET status = 'rejected' WHERE id = %s", (claim_id,))
+            result['outcome'] = APPROVE_LINK_MISSING if not link else APPROVE_LINK_FULL
+            cursor.close()
+            return result
+        
+        cursor.execute("UPDATE claims SET status = 'approved' WHERE id = %s", (claim_id,))
+        
+        cursor.execute("""
+            UPDATE users 
+            SET total_verified_claims = total_verified_claims + 1,
+                free_submissions_available = free_submissions_available
+                    + CASE WHEN total_verified_claims + 1 = 3
+                        OR (%s AND (total_verified_claims + 1) %% 3 = 0) THEN 1 ELSE 0 END
+            WHERE user_id = %s
+            RETURNING total_verified_claims
+        """, (free_every_third, claim['referred_user_id']))
+        total_claims = cursor.fetchone()['total_verified_claims']
+        result['total_claims'] = total_claims
+        result['free_submission_granted'] = total_claims == 3 or (free_every_third and total_claims % 3 == 0)
+        
+        cursor.execute("""
+            UPDATE referral_links 
+            SET current_claims = current_claims + 1
+            WHERE id = %s
+            RETURNING *
+        """, (claim['link_id'],))
+        link = cursor.fetchone()
+        result['link'] = link
+        
+        if link['current_claims'] >= link['max_claims']:
+            # Pending claims can no longer be approved; all claims stay
+            # on record and the link's deletion sets their link_id to NULL
+            cursor.execute(
+                "UPDATE claims SET status = 'rejected' WHERE link_id = %s AND status = 'pending'",
+                (claim['link_id'],)
+            )
+            cursor.execute("DELETE FROM referral_links WHERE id = %s", (claim['link_id'],))
+            result['link_deleted'] = True
+        
+        result['outcome'] = APPROVE_APPROVED
+        if notify:
+            cursor.executemany(OUTBOX_INSERT_QUERY, outbox_rows(notify(result)))
+        cursor.close()
+    category_cache.invalidate()
+    return result
+
 def mark_claim_rewarded(claim_id: int):
     """Mark claim as rewarded"""
     with get_db_connection() as conn:
@@ -286,16 +611,28 @@ def mark_claim_rewarded(claim_id: int):
         """, (claim_id,))
         cursor.close()
 
-def reject_claim(claim_id: int):
-    """Reject a claim"""
+def reject_claim(claim_id: int, notify=None):
+    """Reject a pending claim
+
+    notify, if given, is called with the rejected claim and returns
+    outbox messages to queue in the same transaction.
+
+    Returns the rejected claim, or None if it wasn't pending (e.g. an
+    approval got there first).
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE claims 
             SET status = 'rejected'
-            WHERE id = %s
+            WHERE id = %s AND status = 'pending'
+            RETURNING *
         """, (claim_id,))
+        claim = cursor.fetchone()
+        if claim and notify:
+            cursor.executemany(OUTBOX_INSERT_QUERY, outbox_rows(notify(claim)))
         cursor.close()
+    return claim
 
 def check_duplicate_claim(user_id: int, link_id: int):
     """Check if user already claimed this link"""
@@ -347,32 +684,26 @@ def clear_submission_state(user_id: int):
         cursor.execute("DELETE FROM submission_state WHERE user_id = %s", (user_id,))
         cursor.close()
 
-def get_total_users():
-    """Get total number of users"""
+def get_stats_counters():
+    """Get all trigger-maintained statistics as a dict"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM users")
-        result = cursor.fetchone()
+        cursor.execute("SELECT name, value FROM stats_counters")
+        counters = {row['name']: row['value'] for row in cursor.fetchall()}
         cursor.close()
-        return result['count'] if result else 0
+        return counters
+
+def get_total_users():
+    """Get total number of users"""
+    return get_stats_counters().get('users', 0)
 
 def get_total_links():
     """Get total number of links"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM referral_links")
-        result = cursor.fetchone()
-        cursor.close()
-        return result['count'] if result else 0
+    return get_stats_counters().get('links', 0)
 
 def get_available_links_count():
     """Get count of available links (not maxed out)"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM referral_links WHERE current_claims < max_claims")
-        result = cursor.fetchone()
-        cursor.close()
-        return result['count'] if result else 0
+    return get_stats_counters().get('live_links', 0)
 
 def get_all_links():
     """Get all referral links"""
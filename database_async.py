@@ -0,0 +1,736 @@
+"""Async database access for bot handlers
+
+Mirrors the helpers in database.py on top of psycopg's AsyncConnection
+pool so a slow query only suspends the handler awaiting it instead of
+blocking the whole event loop. Schema setup stays in database.py.
+"""
+
+import asyncio
+import logging
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from contextlib import asynccontextmanager
+
+from database import (
+    get_database_url,
+    get_pool_settings,
+    format_pool_stats,
+    category_cache,
+    CATEGORY_STATS_QUERY,
+    REGISTER_CATEGORY_QUERY,
+    STATS_ACTUAL_QUERY,
+    STATS_ADJUST_QUERY,
+    OUTBOX_INSERT_QUERY,
+    outbox_rows,
+)
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = None
+
+async def open_pool():
+    """Open the process-wide async connection pool (idempotent)"""
+    global _pool, _pool_lock
+    if _pool is not None:
+        return _pool
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            settings = get_pool_settings()
+            pool = AsyncConnectionPool(
+                get_database_url(),
+                kwargs={'row_factory': dict_row},
+                check=AsyncConnectionPool.check_connection,
+                name='refloop-async',
+                open=False,
+                **settings
+            )
+            await pool.open()
+            logger.info("Async database pool opened (min=%d, max=%d)" % (settings['min_size'], settings['max_size']))
+            _pool = pool
+    return _pool
+
+async def close_pool():
+    """Close the async connection pool (safe to call more than once)"""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+def get_pool_stats():
+    """Get async pool usage counters"""
+    if _pool is None:
+        return {}
+    return _pool.get_stats()
+
+def log_pool_stats():
+    """Log and reset the async pool wait metrics collected since the last call"""
+    if _pool is None:
+        return
+    logger.info("Async DB pool: %s" % format_pool_stats(_pool.pop_stats()))
+
+async def check_database(timeout: float):
+    """Run SELECT 1 through the pool; returns None if healthy, else the error"""
+    if _pool is None:
+        return "pool not open"
+    async def probe():
+        async with _pool.connection(timeout=timeout) as conn:
+            await conn.execute("SELECT 1")
+    try:
+        await asyncio.wait_for(probe(), timeout)
+    except asyncio.TimeoutError:
+        return "timed out after %.1fs" % timeout
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    return None
+
+@asynccontextmanager
+async def get_db_connection():
+    """Async context manager for pooled database connections"""
+    pool = _pool or await open_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+# User operations
+async def create_user(user_id: int, username: str):
+    """Create a new user"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            INSERT INTO users (user_id, username)
+            VALUES (%s, %s)
+            ON CONFLICT (user_id) DO NOTHING
+        """, (user_id, username))
+        await cursor.close()
+
+async def get_user(user_id: int):
+    """Get user by ID"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+        user = await cursor.fetchone()
+        await cursor.close()
+        return user
+
+async def get_user_by_id(user_id: int):
+    """Get user by ID (alias for compatibility)"""
+    return await get_user(user_id)
+
+async def update_user_claims(user_id: int):
+    """Increment user's verified claims and handle free submission unlock"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            UPDATE users
+            SET total_verified_claims = total_verified_claims + 1
+            WHERE user_id = %s
+            RETURNING total_verified_claims
+        """, (user_id,))
+        result = await cursor.fetchone()
+        total_claims = result['total_verified_claims']
+
+        # Grant free submission after 3rd claim
+        if total_claims == 3:
+            await cursor.execute("""
+                UPDATE users
+                SET free_submissions_available = free_submissions_available + 1
+                WHERE user_id = %s
+            """, (user_id,))
+
+        await cursor.close()
+        return total_claims
+
+async def use_free_submission(user_id: int):
+    """Decrement free submissions counter"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            UPDATE users
+            SET free_submissions_available = free_submissions_available - 1
+            WHERE user_id = %s AND free_submissions_available > 0
+        """, (user_id,))
+        await cursor.close()
+
+# Referral link operations
+async def create_referral_link(referrer_user_id: int, category: str, service_name: str, url: str, description: str, max_claims: int):
+    """Create a new referral link with specified max claims"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute(REGISTER_CATEGORY_QUERY, (category,))
+        await cursor.execute("""
+            INSERT INTO referral_links (referrer_user_id, category, service_name, url, description, max_claims, current_claims)
+            VALUES (%s, %s, %s, %s, %s, %s, 0)
+            RETURNING id
+        """, (referrer_user_id, category, service_name, url, description, max_claims))
+        result = await cursor.fetchone()
+        link_id = result['id']
+        await cursor.close()
+    category_cache.invalidate()
+    return link_id
+
+async def get_available_links(category: str = None):
+    """Get available referral links (not maxed out)"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if category:
+            await cursor.execute("""
+                SELECT * FROM referral_links
+                WHERE current_claims < max_claims AND category = %s
+                ORDER BY created_at DESC
+            """, (category,))
+        else:
+            await cursor.execute("""
+                SELECT * FROM referral_links
+                WHERE current_claims < max_claims
+                ORDER BY created_at DESC
+            """)
+        links = await cursor.fetchall()
+        await cursor.close()
+        return links
+
+async def get_category_page(category: str, limit: int, cursor: tuple = None, backward: bool = False):
+    """Get one page of available links in a category with referrer usernames
+
+    Keyset pagination over (created_at, id), newest first. cursor is the
+    (created_at, id) of a row on the current page: with backward=False
+    the rows after it are returned (next page), with backward=True the
+    rows before it (previous page). Rows are always returned newest
+    first and at most `limit` of them.
+    """
+    async with get_db_connection() as conn:
+        db_cursor = conn.cursor()
+        if cursor is None:
+            await db_cursor.execute("""
+                SELECT l.*, u.username AS referrer_username
+                FROM referral_links l
+                LEFT JOIN users u ON u.user_id = l.referrer_user_id
+                WHERE l.category = %s AND l.current_claims < l.max_claims
+                ORDER BY l.created_at DESC, l.id DESC
+                LIMIT %s
+            """, (category, limit))
+        elif backward:
+            await db_cursor.execute("""
+                SELECT l.*, u.username AS referrer_username
+                FROM referral_links l
+                LEFT JOIN users u ON u.user_id = l.referrer_user_id
+                WHERE l.category = %s AND l.current_claims < l.max_claims
+                  AND (l.created_at, l.id) > (%s, %s)
+                ORDER BY l.created_at ASC, l.id ASC
+                LIMIT %s
+            """, (category, cursor[0], cursor[1], limit))
+        else:
+            await db_cursor.execute("""
+                SELECT l.*, u.username AS referrer_username
+                FROM referral_links l
+                LEFT JOIN users u ON u.user_id = l.referrer_user_id
+                WHERE l.category = %s AND l.current_claims < l.max_claims
+                  AND (l.created_at, l.id) < (%s, %s)
+                ORDER BY l.created_at DESC, l.id DESC
+                LIMIT %s
+            """, (category, cursor[0], cursor[1], limit))
+        links = await db_cursor.fetchall()
+        await db_cursor.close()
+        if backward:
+            links.reverse()
+        return links
+
+async def get_link_by_id(link_id: int):
+    """Get referral link by ID"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT * FROM referral_links WHERE id = %s", (link_id,))
+        link = await cursor.fetchone()
+        await cursor.close()
+        return link
+
+async def increment_link_claims(link_id: int):
+    """Increment current claims for a link and return updated values"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            UPDATE referral_links
+            SET current_claims = current_claims + 1
+            WHERE id = %s
+            RETURNING current_claims, max_claims, service_name, referrer_user_id
+        """, (link_id,))
+        result = await cursor.fetchone()
+        await cursor.close()
+    category_cache.invalidate()
+    return result
+
+# Outcomes of reserve_link()
+RESERVE_RESERVED = 'reserved'
+RESERVE_EXHAUSTED = 'exhausted'
+RESERVE_OWN_LINK = 'own_link'
+RESERVE_MISSING = 'missing'
+
+async def reserve_link(link_id: int, user_id: int, notify=None):
+    """Atomically claim one use of a link for a user
+
+    Runs a single conditional UPDATE so two users racing for the last
+    slot cannot both get the link. Returns (outcome, link) where outcome
+    is one of the RESERVE_* constants and link is the row as it was
+    before the reservation (None if the link does not exist).
+
+    notify, if given, is called with the link once it is reserved and
+    returns outbox messages to queue in the same transaction.
+    """
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            WITH target AS (
+                SELECT * FROM referral_links WHERE id = %s
+            ), reserved AS (
+                UPDATE referral_links l
+                SET current_claims = l.current_claims + 1
+                FROM target t
+                WHERE l.id = t.id
+                  AND l.current_claims < l.max_claims
+                  AND l.referrer_user_id <> %s
+                RETURNING l.id
+            )
+            SELECT t.*, (r.id IS NOT NULL) AS reserved
+            FROM target t
+            LEFT JOIN reserved r ON r.id = t.id
+        """, (link_id, user_id))
+        link = await cursor.fetchone()
+        if link and link['reserved'] and notify:
+            await cursor.executemany(OUTBOX_INSERT_QUERY, outbox_rows(notify(link)))
+        await cursor.close()
+
+    if not link:
+        return RESERVE_MISSING, None
+    if link.pop('reserved'):
+        category_cache.invalidate()
+        return RESERVE_RESERVED, link
+    if link['referrer_user_id'] == user_id:
+        return RESERVE_OWN_LINK, link
+    return RESERVE_EXHAUSTED, link
+
+async def delete_referral_link(link_id: int):
+    """Delete a referral link that has reached its limit"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            DELETE FROM referral_links
+            WHERE id = %s
+        """, (link_id,))
+        await cursor.close()
+    category_cache.invalidate()
+
+async def retire_referral_link(link_id: int):
+    """Delete a referral link, keeping its claims on record
+
+    Pending claims are rejected; the link's deletion sets every claim's
+    link_id to NULL (migration 0006). The link is locked first, in the
+    same order approve_claim_atomic takes its locks. Returns the number
+    of pending claims rejected, or None if the link doesn't exist.
+    """
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT id FROM referral_links WHERE id = %s FOR UPDATE", (link_id,))
+        if await cursor.fetchone() is None:
+            await cursor.close()
+            return None
+        await cursor.execute(
+            "UPDATE claims SET status = 'rejected' WHERE link_id = %s AND status = 'pending'",
+            (link_id,)
+        )
+        rejected = cursor.rowcount
+        await cursor.execute("DELETE FROM referral_links WHERE id = %s", (link_id,))
+        await cursor.close()
+    category_cache.invalidate()
+    return rejected
+
+async def load_category_stats():
+    """Query all categories with link counts and refresh the cache"""
+    generation = category_cache.generation()
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute(CATEGORY_STATS_QUERY)
+        entries = await cursor.fetchall()
+        await cursor.close()
+    category_cache.set(entries, generation)
+    return entries
+
+async def get_category_stats():
+    """Get categories that have links, with total and live counts (cached)"""
+    entries = category_cache.get()
+    if entries is None:
+        entries = await load_category_stats()
+    return [row for row in entries if row['links']]
+
+async def get_category_name(category_id: int):
+    """Resolve a stable category ID to its name, from memory when possible"""
+    name = category_cache.name(category_id)
+    if name is None:
+        await load_category_stats()
+        name = category_cache.name(category_id)
+    return name
+
+async def get_categories():
+    """Get all unique categories"""
+    return [row['category'] for row in await get_category_stats()]
+
+async def get_category_counts():
+    """Get number of available links per category"""
+    return {row['category']: row['live_links'] for row in await get_category_stats()}
+
+# Claim operations
+async def create_claim(referred_user_id: int, link_id: int, screenshot_file_id: str):
+    """Create a new claim"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            INSERT INTO claims (referred_user_id, link_id, screenshot_file_id)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        """, (referred_user_id, link_id, screenshot_file_id))
+        result = await cursor.fetchone()
+        claim_id = result['id']
+        await cursor.close()
+        return claim_id
+
+async def get_claim(claim_id: int):
+    """Get claim by ID"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT * FROM claims WHERE id = %s", (claim_id,))
+        claim = await cursor.fetchone()
+        await cursor.close()
+        return claim
+
+async def approve_claim(claim_id: int):
+    """Approve a claim"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            UPDATE claims
+            SET status = 'approved'
+            WHERE id = %s
+        """, (claim_id,))
+        await cursor.close()
+
+async def mark_claim_rewarded(claim_id: int):
+    """Mark claim as rewarded"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            UPDATE claims
+            SET rewarded = TRUE
+            WHERE id = %s
+        """, (claim_id,))
+        await cursor.close()
+
+async def reject_claim(claim_id: int):
+    """Reject a pending claim; returns it, or None if it wasn't pending"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            UPDATE claims
+            SET status = 'rejected'
+            WHERE id = %s AND status = 'pending'
+            RETURNING *
+        """, (claim_id,))
+        claim = await cursor.fetchone()
+        await cursor.close()
+        return claim
+
+async def check_duplicate_claim(user_id: int, link_id: int):
+    """Check if user already claimed this link"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            SELECT COUNT(*) as count FROM claims
+            WHERE referred_user_id = %s AND link_id = %s
+        """, (user_id, link_id))
+        result = await cursor.fetchone()
+        count = result['count']
+        await cursor.close()
+        return count > 0
+
+# Submission state operations (for webhook persistence)
+
+async def save_submission_state(user_id: int, state: str = None, plan: str = None, category: str = None,
+                                service_name: str = None, url: str = None, description: str = None, max_claims: int = None):
+    """Save or update submission state for a user"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            INSERT INTO submission_state (user_id, state, plan, category, service_name, url, description, max_claims, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                state = COALESCE(EXCLUDED.state, submission_state.state),
+                plan = COALESCE(EXCLUDED.plan, submission_state.plan),
+                category = COALESCE(EXCLUDED.category, submission_state.category),
+                service_name = COALESCE(EXCLUDED.service_name, submission_state.service_name),
+                url = COALESCE(EXCLUDED.url, submission_state.url),
+                description = COALESCE(EXCLUDED.description, submission_state.description),
+                max_claims = COALESCE(EXCLUDED.max_claims, submission_state.max_claims),
+                updated_at = CURRENT_TIMESTAMP
+        """, (user_id, state, plan, category, service_name, url, description, max_claims))
+        await cursor.close()
+
+async def get_submission_state(user_id: int):
+    """Get submission state for a user"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT * FROM submission_state WHERE user_id = %s", (user_id,))
+        state = await cursor.fetchone()
+        await cursor.close()
+        return state
+
+async def clear_submission_state(user_id: int):
+    """Clear submission state for a user"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("DELETE FROM submission_state WHERE user_id = %s", (user_id,))
+        await cursor.close()
+
+async def load_submission_states(ttl: float):
+    """Get all submission drafts updated within the last ttl seconds"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            SELECT *, EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - updated_at)) AS age
+            FROM submission_state
+            WHERE updated_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (ttl,))
+        states = await cursor.fetchall()
+        await cursor.close()
+        return states
+
+async def load_submission_state(user_id: int, ttl: float):
+    """Get a user's submission draft if updated within the last ttl seconds"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            SELECT * FROM submission_state
+            WHERE user_id = %s
+              AND updated_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (user_id, ttl))
+        state = await cursor.fetchone()
+        await cursor.close()
+        return state
+
+async def upsert_submission_states(rows):
+    """Write complete submission drafts in one batch"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.executemany("""
+            INSERT INTO submission_state (user_id, state, plan, category, service_name, url, description, max_claims, updated_at)
+            VALUES (%(user_id)s, %(state)s, %(plan)s, %(category)s, %(service_name)s, %(url)s, %(description)s, %(max_claims)s, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                state = EXCLUDED.state,
+                plan = EXCLUDED.plan,
+                category = EXCLUDED.category,
+                service_name = EXCLUDED.service_name,
+                url = EXCLUDED.url,
+                description = EXCLUDED.description,
+                max_claims = EXCLUDED.max_claims,
+                updated_at = CURRENT_TIMESTAMP
+        """, rows)
+        await cursor.close()
+
+async def delete_stale_submission_states(ttl: float, batch_size: int):
+    """Delete drafts older than ttl seconds, batch_size rows per transaction"""
+    total = 0
+    while True:
+        async with get_db_connection() as conn:
+            cursor = conn.cursor()
+            await cursor.execute("""
+                DELETE FROM submission_state
+                WHERE user_id IN (
+                    SELECT user_id FROM submission_state
+                    WHERE updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    LIMIT %s
+                )
+            """, (ttl, batch_size))
+            deleted = cursor.rowcount
+            await cursor.close()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+async def process_outbox(deliver, batch_size: int, max_attempts: int, retry_delay: float, lease: float):
+    """Deliver one batch of due outbox messages
+
+    Due rows are leased in a short transaction: FOR UPDATE SKIP LOCKED
+    picks them, their attempts are bumped and available_at is pushed
+    lease seconds ahead, so other dispatchers skip them and rows of a
+    crashed dispatcher become due again once the lease runs out.
+    deliver(rows) then runs with no transaction or connection held and
+    returns {id: None} for sent rows or {id: (error, retryable)} for
+    failures; retryable ones are rescheduled with exponential backoff
+    until max_attempts. Results are recorded in a second short
+    transaction, only for rows still carrying this lease's attempt
+    number. Returns the number of rows handled.
+    """
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            UPDATE outbox
+            SET attempts = attempts + 1,
+                available_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'pending' AND available_at <= CURRENT_TIMESTAMP
+                ORDER BY available_at, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        """, (lease, batch_size))
+        rows = sorted(await cursor.fetchall(), key=lambda row: row['id'])
+        await cursor.close()
+    if not rows:
+        return 0
+
+    results = await deliver(rows)
+    sent, failed = [], []
+    for row in rows:
+        outcome = results.get(row['id'], ("not delivered", True))
+        if outcome is None:
+            sent.append((row['id'], row['attempts']))
+            continue
+        error, retryable = outcome
+        done = not retryable or row['attempts'] >= max_attempts
+        failed.append({
+            'id': row['id'],
+            'attempts': row['attempts'],
+            'status': 'failed' if done else 'pending',
+            'error': str(error)[:500],
+            'delay': retry_delay * 2 ** (row['attempts'] - 1),
+        })
+
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if sent:
+            await cursor.executemany("""
+                UPDATE outbox
+                SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL
+                WHERE id = %s AND attempts = %s
+            """, sent)
+        if failed:
+            await cursor.executemany("""
+                UPDATE outbox
+                SET status = %(status)s, last_error = %(error)s,
+                    available_at = CURRENT_TIMESTAMP + make_interval(secs => %(delay)s)
+                WHERE id = %(id)s AND attempts = %(attempts)s
+            """, failed)
+        await cursor.close()
+    return len(rows)
+
+async def delete_old_outbox(retention: float, batch_size: int):
+    """Delete delivered or failed outbox rows older than retention seconds"""
+    total = 0
+    while True:
+        async with get_db_connection() as conn:
+            cursor = conn.cursor()
+            await cursor.execute("""
+                DELETE FROM outbox
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status <> 'pending'
+                      AND created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    LIMIT %s
+                )
+            """, (retention, batch_size))
+            deleted = cursor.rowcount
+            await cursor.close()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+async def get_stats_counters():
+    """Get all trigger-maintained statistics as a dict"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT name, value FROM stats_counters")
+        counters = {row['name']: row['value'] for row in await cursor.fetchall()}
+        await cursor.close()
+        return counters
+
+async def reconcile_stats_counters():
+    """Correct drift in stats_counters and return the corrections made
+
+    The recount and the counters are read in one REPEATABLE READ
+    snapshot, so they agree on which writes are included; the recount
+    takes no locks writers wait on. Drift is then applied as deltas in
+    a short second transaction, on top of whatever the triggers have
+    added meanwhile.
+    """
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        await cursor.execute("SELECT name, value FROM stats_counters")
+        counters = {row['name']: row['value'] for row in await cursor.fetchall()}
+        await cursor.execute(STATS_ACTUAL_QUERY)
+        actual = {row['name']: row['value'] for row in await cursor.fetchall()}
+        await conn.commit()
+
+        drift = {name: value - counters.get(name, 0) for name, value in actual.items() if value != counters.get(name, 0)}
+        if drift:
+            await cursor.executemany(STATS_ADJUST_QUERY, list(drift.items()))
+        await cursor.close()
+    return drift
+
+async def get_total_users():
+    """Get total number of users"""
+    return (await get_stats_counters()).get('users', 0)
+
+async def get_total_links():
+    """Get total number of links"""
+    return (await get_stats_counters()).get('links', 0)
+
+async def get_available_links_count():
+    """Get count of available links (not maxed out)"""
+    return (await get_stats_counters()).get('live_links', 0)
+
+async def get_dashboard_stats():
+    """Get every admin dashboard figure and the latest pending claims in one query
+
+    Counts come from the trigger-maintained stats_counters table, so the
+    cost doesn't grow with the size of the claims and links tables.
+    """
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            WITH pending AS (
+                SELECT c.id, c.referred_user_id, u.username, l.service_name, l.category, c.created_at
+                FROM claims c
+                JOIN users u ON c.referred_user_id = u.user_id
+                JOIN referral_links l ON c.link_id = l.id
+                WHERE c.status = 'pending'
+                ORDER BY c.created_at DESC
+                LIMIT 5
+            )
+            SELECT
+                COALESCE(MAX(value) FILTER (WHERE name = 'users'), 0) AS total_users,
+                COALESCE(MAX(value) FILTER (WHERE name = 'links'), 0) AS total_links,
+                COALESCE(MAX(value) FILTER (WHERE name = 'live_links'), 0) AS active_links,
+                COALESCE(MAX(value) FILTER (WHERE name = 'stars_received'), 0) AS stars_received,
+                COALESCE(MAX(value) FILTER (WHERE name = 'claims'), 0) AS total_claims,
+                COALESCE(MAX(value) FILTER (WHERE name = 'claims_pending'), 0) AS pending_claims,
+                COALESCE(MAX(value) FILTER (WHERE name = 'claims_approved'), 0) AS approved_claims,
+                COALESCE(MAX(value) FILTER (WHERE name = 'claims_rejected'), 0) AS rejected_claims,
+                COALESCE(
+                    (SELECT json_agg(pending ORDER BY pending.created_at DESC) FROM pending),
+                    '[]'::json
+                ) AS pending_list
+            FROM stats_counters
+        """)
+        stats = await cursor.fetchone()
+        await cursor.close()
+        return stats
+
+async def get_all_links():
+    """Get all referral links"""
+    async with get_db_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT * FROM referral_links ORDER BY created_at DESC")
+        links = await cursor.fetchall()
+        await cursor.close()
+        return links
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """Keep-alive system for Render free tier"""
 
+import time
 import asyncio
 import logging
 from datetime import datetime
@@ -11,41 +12,99 @@ logger = logging.getLogger(__name__)
 class KeepAlive:
     """Keep-alive system to prevent Render from sleeping"""
     
-    def __init__(self, url: str, interval: int = 840):
+    def __init__(self, url: str, interval: int = 840, last_activity=None):
         """
         Initialize keep-alive system
         
         Args:
             url: The URL to ping (your Render app URL)
-            interval: Ping interval in seconds (default: 840 = 14 minutes)
+            interval: Idle window in seconds (default: 840 = 14 minutes)
+            last_activity: Optional callable returning the time.monotonic()
+                of the last real update (or None); pings are skipped while
+                real traffic keeps the instance awake
         """
         self.url = url
         self.interval = interval
+        self.last_activity = last_activity
         self.running = False
         self.task = None
+        self.session = None
+        self.last_ping = None
+        self.last_rtt = None
+        self.pings = 0
+        self.skipped = 0
+        self.total_rtt = 0.0
+    
+    def _idle_since(self):
+        """Monotonic time of the last inbound request we know about"""
+        latest = self.last_ping
+        activity = self.last_activity() if self.last_activity else None
+        if activity is not None and (latest is None or activity > latest):
+            latest = activity
+        return latest
+    
+    async def _get(self):
+        """GET the URL on the shared session and return the status code"""
+        if self.session is None or self.session.closed:
+            # One session for all pings, so the connection (and DNS/TLS) is reused
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10),
+                connector=aiohttp.TCPConnector(limit=1, ttl_dns_cache=3600, keepalive_timeout=self.interval + 60),
+            )
+        async with self.session.get(self.url) as response:
+            # Read the body so the connection goes back to the pool
+            await response.read()
+            return response.status
     
     async def ping(self):
         """Ping the server to keep it alive"""
+        started = time.monotonic()
+        self.last_ping = started
         try:
-            async with aiohttp.ClientSession() as session:
-                # Ping root URL since /health endpoint is not available
-                async with session.get(self.url, timeout=10) as response:
-                    if response.status in [200, 404]:  # 404 is ok, means server is up
-                        logger.info(f"✅ Keep-alive ping successful at {datetime.now()}")
-                    else:
-                        logger.warning(f"⚠️ Keep-alive ping returned status {response.status}")
+            try:
+                status = await self._get()
+            except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError):
+                # The load balancer usually closes the pooled connection while
+                # it idles between pings; retry once on a fresh connection
+                started = time.monotonic()
+                status = await self._get()
+            rtt = time.monotonic() - started
+            if status in [200, 404]:  # 404 is ok, means server is up
+                self.pings += 1
+                self.total_rtt += rtt
+                self.last_rtt = rtt
+                logger.info(f"✅ Keep-alive ping successful at {datetime.now()} ({rtt * 1000:.0f} ms)")
+            else:
+                logger.warning(f"⚠️ Keep-alive ping returned status {status}")
         except Exception as e:
             logger.error(f"❌ Keep-alive ping failed: {e}")
     
+    def stats(self):
+        """Ping counters and round-trip times in milliseconds"""
+        return {
+            'pings': self.pings,
+            'skipped': self.skipped,
+            'last_rtt_ms': round(self.last_rtt * 1000, 1) if self.last_rtt is not None else None,
+            'avg_rtt_ms': round(self.total_rtt / self.pings * 1000, 1) if self.pings else None,
+        }
+    
     async def run(self):
         """Run the keep-alive loop"""
         self.running = True
-        logger.info(f"🔄 Keep-alive started (pinging every {self.interval} seconds)")
+        logger.info(f"🔄 Keep-alive started (pinging after {self.interval} idle seconds)")
         
+        # Starting up counts as activity: the first ping is one window away
+        self.last_ping = time.monotonic()
         while self.running:
-            await asyncio.sleep(self.interval)
-            if self.running:  # Check again after sleep
+            idle = time.monotonic() - self._idle_since()
+            if idle >= self.interval:
                 await self.ping()
+                continue
+            await asyncio.sleep(self.interval - idle)
+            if time.monotonic() - self.last_ping >= self.interval and self._idle_since() != self.last_ping:
+                # A ping was due, but real updates already kept us awake
+                self.skipped += 1
+                logger.debug("Keep-alive ping skipped: recent updates")
     
     async def start(self, application=None):
         """Start the keep-alive system"""
@@ -53,9 +112,16 @@ class KeepAlive:
             self.task = asyncio.create_task(self.run())
             logger.info("🚀 Keep-alive system started")
     
-    def stop(self):
+    async def stop(self):
         """Stop the keep-alive system"""
         self.running = False
         if self.task and not self.task.done():
             self.task.cancel()
-            logger.info("🛑 Keep-alive system stopped")
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            logger.info(f"🛑 Keep-alive system stopped ({self.pings} pings, {self.skipped} skipped)")
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
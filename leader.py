@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Leader election for polling instances
+
+Telegram allows only one getUpdates consumer per bot token, so
+instances that poll agree on a leader through a Postgres session-level
+advisory lock held on a dedicated connection. Standbys retry the lock
+every LEADER_RETRY_INTERVAL seconds. If the leader process dies, its
+connection closes and Postgres releases the lock. If the leader's host
+disappears, the TCP keepalives set on the session let the server notice
+within about LEADER_KEEPALIVE_IDLE + 3 * LEADER_KEEPALIVE_INTERVAL
+seconds. A standby therefore takes over within that time plus one retry
+interval.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+import psycopg
+
+from database import get_database_url
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_ID = 7_310_002
+
+class LeaderLock:
+    """Session advisory lock marking the instance allowed to poll"""
+
+    def __init__(self, lock_id: int = LEADER_LOCK_ID):
+        self.lock_id = lock_id
+        self.retry_interval = float(os.getenv('LEADER_RETRY_INTERVAL', '2'))
+        self.check_interval = float(os.getenv('LEADER_CHECK_INTERVAL', '5'))
+        self.keepalive_idle = int(os.getenv('LEADER_KEEPALIVE_IDLE', '10'))
+        self.keepalive_interval = int(os.getenv('LEADER_KEEPALIVE_INTERVAL', '5'))
+        self._conn = None
+        self.is_leader = False
+
+    async def _connect(self):
+        conn = await psycopg.AsyncConnection.connect(
+            get_database_url(),
+            autocommit=True,
+            keepalives=1,
+            keepalives_idle=self.keepalive_idle,
+            keepalives_interval=self.keepalive_interval,
+            keepalives_count=3,
+        )
+        # Server side: drop our session (and the lock) soon after we vanish
+        await conn.execute("SET tcp_keepalives_idle = %d" % self.keepalive_idle)
+        await conn.execute("SET tcp_keepalives_interval = %d" % self.keepalive_interval)
+        await conn.execute("SET tcp_keepalives_count = 3")
+        return conn
+
+    async def acquire(self, stop_event: asyncio.Event):
+        """Wait until this instance holds the lock; False if stopped first"""
+        waited_since = time.monotonic()
+        announced = False
+        while not stop_event.is_set():
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = await self._connect()
+                cursor = await self._conn.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_id,))
+                if (await cursor.fetchone())[0]:
+                    self.is_leader = True
+                    logger.info("Acquired leadership after %.1fs" % (time.monotonic() - waited_since))
+                    return True
+                if not announced:
+                    logger.info("Another instance is polling; waiting as standby")
+                    announced = True
+            except psycopg.Error as e:
+                logger.error("Leader lock attempt failed: %s" % str(e))
+                await self._close()
+            try:
+                await asyncio.wait_for(stop_event.wait(), self.retry_interval)
+            except asyncio.TimeoutError:
+                pass
+        return False
+
+    async def hold(self, stop_event: asyncio.Event):
+        """Keep checking the lock connection until stopped
+
+        Returns True if stop_event was set, False if the connection (and
+        with it the lock) was lost.
+        """
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), self.check_interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.wait_for(self._conn.execute("SELECT 1"), self.check_interval)
+            except Exception as e:
+                logger.error("Lost the leader lock connection: %s" % (str(e) or e.__class__.__name__))
+                self.is_leader = False
+                await self._close()
+                return False
+        return True
+
+    async def release(self):
+        """Give up leadership so a standby can take over immediately"""
+        if self.is_leader and self._conn is not None and not self._conn.closed:
+            try:
+                await self._conn.execute("SELECT pg_advisory_unlock(%s)", (self.lock_id,))
+                logger.info("Released leadership")
+            except psycopg.Error as e:
+                logger.warning("Leader unlock failed (closing the session releases it): %s" % str(e))
+        self.is_leader = False
+        await self._close()
+
+    async def _close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                await conn.close()
+            except Exception:
+                pass
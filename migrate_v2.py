@@ -1,104 +1,61 @@
 #!/usr/bin/env python3
 """
-Migration script for RefLoop Bot v2.0
-Renames used_claims to current_claims in referral_links table
+Manual migration runner for RefLoop Bot
+Applies pending versioned migrations from migrations/ (the bot also does
+this automatically at startup). The old used_claims -> current_claims
+rename is part of migration 0001.
+
+Usage:
+    python migrate_v2.py            # show status and apply pending migrations
+    python migrate_v2.py --status   # only show status
 """
 
 import os
 import sys
 from dotenv import load_dotenv
-import psycopg2
 
 # Load environment variables
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-def migrate():
-    """Run migration"""
-    print("🔄 Starting migration to v2.0...")
-    
+def main():
+    """Show migration status and apply pending migrations"""
+    import migrations
+
+    current = migrations.current_version()
+    latest = migrations.latest_version()
+    print(f"  📊 Schema version: {current} (latest: {latest})")
+
+    pending = [(v, name) for v, name, _ in migrations.discover() if v > current]
+    for version, name in pending:
+        print(f"    - pending: {version:04d}_{name}")
+
+    if not pending:
+        print("\n✅ Database is up to date")
+        return
+
+    if '--status' in sys.argv:
+        return
+
+    print("\n🔄 Applying migrations...")
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        
-        # Check if migration is needed
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='referral_links' AND column_name='used_claims'
-        """)
-        
-        if cursor.fetchone():
-            print("  📝 Renaming used_claims to current_claims...")
-            cursor.execute("""
-                ALTER TABLE referral_links 
-                RENAME COLUMN used_claims TO current_claims
-            """)
-            conn.commit()
-            print("  ✅ Column renamed successfully!")
-        else:
-            print("  ℹ️  Migration already applied or column doesn't exist")
-        
-        # Verify the change
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='referral_links' AND column_name='current_claims'
-        """)
-        
-        if cursor.fetchone():
-            print("  ✅ Verified: current_claims column exists")
-        else:
-            print("  ❌ Error: current_claims column not found")
-            sys.exit(1)
-        
-        # Show current links
-        cursor.execute("""
-            SELECT COUNT(*) FROM referral_links
-        """)
-        count = cursor.fetchone()[0]
-        print(f"  📊 Current referral links: {count}")
-        
-        if count > 0:
-            cursor.execute("""
-                SELECT 
-                    service_name, 
-                    current_claims, 
-                    max_claims 
-                FROM referral_links 
-                LIMIT 5
-            """)
-            print("\n  Sample links:")
-            for row in cursor.fetchall():
-                print(f"    - {row[0]}: {row[1]}/{row[2]} claims")
-        
-        cursor.close()
-        conn.close()
-        
-        print("\n✅ Migration completed successfully!")
-        print("\n📝 Next steps:")
-        print("  1. Restart your bot: python bot.py")
-        print("  2. Test the new plan selection")
-        print("  3. Verify auto-deletion works")
-        
+        applied = migrations.migrate()
     except Exception as e:
         print(f"\n❌ Migration failed: {e}")
         sys.exit(1)
 
+    print(f"\n✅ Applied {len(applied)} migration(s)")
+
 if __name__ == '__main__':
     if not DATABASE_URL:
         print("❌ DATABASE_URL not set in environment")
         print("Please set it in your .env file or environment variables")
         sys.exit(1)
-    
-    print("RefLoop Bot v2.0 Migration")
+
+    print("RefLoop Bot Migrations")
     print("=" * 50)
     print(f"Database: {DATABASE_URL[:30]}...")
     print()
-    
-    response = input("Continue with migration? (yes/no): ")
-    if response.lower() in ['yes', 'y']:
-        migrate()
-    else:
-        print("Migration cancelled")
+
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Initial schema: users, referral links, claims and submission state
+
+Written with IF NOT EXISTS so it is a no-op baseline on databases that
+were created before versioned migrations existed.
+"""
+
+TRANSACTIONAL = True
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    # Users table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255) NOT NULL,
+            free_submissions_available INTEGER DEFAULT 0,
+            total_verified_claims INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Referral links table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS referral_links (
+            id SERIAL PRIMARY KEY,
+            referrer_user_id BIGINT NOT NULL,
+            category TEXT NOT NULL,
+            service_name TEXT NOT NULL,
+            url TEXT NOT NULL,
+            description TEXT,
+            max_claims INTEGER NOT NULL,
+            current_claims INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (referrer_user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # Migrate old column name if exists
+    cursor.execute("""
+        DO $$ 
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns 
+                WHERE table_name='referral_links' AND column_name='used_claims'
+            ) THEN
+                ALTER TABLE referral_links RENAME COLUMN used_claims TO current_claims;
+            END IF;
+        END $$;
+    """)
+    
+    # Claims table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS claims (
+            id SERIAL PRIMARY KEY,
+            referred_user_id BIGINT NOT NULL,
+            link_id INTEGER NOT NULL,
+            screenshot_file_id VARCHAR(255) NOT NULL,
+            status VARCHAR(50) DEFAULT 'pending',
+            rewarded BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (referred_user_id) REFERENCES users(user_id),
+            FOREIGN KEY (link_id) REFERENCES referral_links(id),
+            UNIQUE(referred_user_id, link_id)
+        )
+    """)
+    
+    # Temporary submission state table (for webhook persistence)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS submission_state (
+            user_id BIGINT PRIMARY KEY,
+            state VARCHAR(50),
+            plan VARCHAR(10),
+            category TEXT,
+            service_name TEXT,
+            url TEXT,
+            description TEXT,
+            max_claims INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+        )
+    """)
+    
+    cursor.close()
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Secondary indexes for browsing, the claims queue and link cleanup"""
+
+from migrations import create_indexes_concurrently
+
+TRANSACTIONAL = False
+
+INDEXES = {
+    # Browse pages: live links per category, newest first
+    'idx_referral_links_live_category': (
+        "ON referral_links (category, created_at DESC, id DESC) "
+        "WHERE current_claims < max_claims"
+    ),
+    # Pending claims review queue
+    'idx_claims_status_created': "ON claims (status, created_at)",
+    # Claims lookup/cleanup when a link is deleted
+    'idx_claims_link_id': "ON claims (link_id)",
+}
+
+def upgrade(conn):
+    create_indexes_concurrently(conn, INDEXES)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Categories table giving each category a stable ID for callback data"""
+
+TRANSACTIONAL = True
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Register the categories already in use
+    cursor.execute("""
+        INSERT INTO categories (name)
+        SELECT DISTINCT category FROM referral_links
+        ORDER BY category
+        ON CONFLICT (name) DO NOTHING
+    """)
+    
+    cursor.close()
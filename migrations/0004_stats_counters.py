@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Trigger-maintained counters for O(1) statistics
+
+stats_counters holds one row per statistic. Row triggers on users,
+referral_links and claims apply +/- deltas as rows change, so reading
+a statistic no longer scans the table. The bot periodically recounts
+them to correct any drift (database_async.reconcile_stats_counters).
+
+The SQL is kept here rather than imported, so the migration stays as
+it was applied whatever happens to the application code later.
+"""
+
+TRANSACTIONAL = True
+
+# Statistics kept in stats_counters
+STATS_COUNTERS = (
+    'users',
+    'links',
+    'live_links',
+    'stars_received',
+    'claims',
+    'claims_pending',
+    'claims_approved',
+    'claims_rejected',
+)
+
+# Seeds every counter from the tables
+SEED_STATS_QUERY = """
+    INSERT INTO stats_counters (name, value, updated_at)
+    SELECT actual.name, actual.value, CURRENT_TIMESTAMP
+    FROM
+        (SELECT COUNT(*) AS users FROM users) u,
+        (
+            SELECT
+                COUNT(*) AS links,
+                COUNT(*) FILTER (WHERE current_claims < max_claims) AS live_links,
+                COALESCE(SUM(refloop_link_stars(max_claims)), 0) AS stars_received
+            FROM referral_links
+        ) l,
+        (
+            SELECT
+                COUNT(*) AS claims,
+                COUNT(*) FILTER (WHERE status = 'pending') AS claims_pending,
+                COUNT(*) FILTER (WHERE status = 'approved') AS claims_approved,
+                COUNT(*) FILTER (WHERE status = 'rejected') AS claims_rejected
+            FROM claims
+        ) c,
+        LATERAL (VALUES
+            ('users', u.users),
+            ('links', l.links),
+            ('live_links', l.live_links),
+            ('stars_received', l.stars_received),
+            ('claims', c.claims),
+            ('claims_pending', c.claims_pending),
+            ('claims_approved', c.claims_approved),
+            ('claims_rejected', c.claims_rejected)
+        ) AS actual(name, value)
+    ON CONFLICT (name) DO UPDATE SET
+        value = EXCLUDED.value,
+        updated_at = EXCLUDED.updated_at
+"""
+
+def upgrade(conn):
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        INSERT INTO stats_counters (name)
+        SELECT unnest(%s::text[])
+        ON CONFLICT (name) DO NOTHING
+    """, (list(STATS_COUNTERS),))
+
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION refloop_bump_counter(counter TEXT, delta BIGINT)
+        RETURNS void AS $$
+        BEGIN
+            IF delta <> 0 THEN
+                UPDATE stats_counters
+                SET value = value + delta, updated_at = CURRENT_TIMESTAMP
+                WHERE name = counter;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # Stars estimate per link, as shown on the admin dashboard
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION refloop_link_stars(max_claims INTEGER)
+        RETURNS BIGINT AS $$
+            SELECT CASE
+                WHEN max_claims = 5 THEN 25
+                WHEN max_claims = 10 THEN 40
+                WHEN max_claims = 30 THEN 100
+                ELSE 0
+            END::BIGINT
+        $$ LANGUAGE sql IMMUTABLE
+    """)
+
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION refloop_count_users()
+        RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM refloop_bump_counter('users', 1);
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM refloop_bump_counter('users', -1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION refloop_count_links()
+        RETURNS trigger AS $$
+        DECLARE
+            old_links BIGINT := 0; new_links BIGINT := 0;
+            old_live BIGINT := 0; new_live BIGINT := 0;
+            old_stars BIGINT := 0; new_stars BIGINT := 0;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                old_links := 1;
+                old_live := (OLD.current_claims < OLD.max_claims)::int;
+                old_stars := refloop_link_stars(OLD.max_claims);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                new_links := 1;
+                new_live := (NEW.current_claims < NEW.max_claims)::int;
+                new_stars := refloop_link_stars(NEW.max_claims);
+            END IF;
+            PERFORM refloop_bump_counter('links', new_links - old_links);
+            PERFORM refloop_bump_counter('live_links', new_live - old_live);
+            PERFORM refloop_bump_counter('stars_received', new_stars - old_stars);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION refloop_count_claims()
+        RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                IF TG_OP = 'DELETE' THEN
+                    PERFORM refloop_bump_counter('claims', -1);
+                END IF;
+                IF OLD.status IN ('pending', 'approved', 'rejected') THEN
+                    PERFORM refloop_bump_counter('claims_' || OLD.status, -1);
+                END IF;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM refloop_bump_counter('claims', 1);
+                END IF;
+                IF NEW.status IN ('pending', 'approved', 'rejected') THEN
+                    PERFORM refloop_bump_counter('claims_' || NEW.status, 1);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    cursor.execute("DROP TRIGGER IF EXISTS refloop_count_users ON users")
+    cursor.execute("""
+        CREATE TRIGGER refloop_count_users
+        AFTER INSERT OR DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION refloop_count_users()
+    """)
+
+    cursor.execute("DROP TRIGGER IF EXISTS refloop_count_links ON referral_links")
+    cursor.execute("""
+        CREATE TRIGGER refloop_count_links
+        AFTER INSERT OR DELETE OR UPDATE OF current_claims, max_claims ON referral_links
+        FOR EACH ROW EXECUTE FUNCTION refloop_count_links()
+    """)
+
+    cursor.execute("DROP TRIGGER IF EXISTS refloop_count_claims ON claims")
+    cursor.execute("""
+        CREATE TRIGGER refloop_count_claims
+        AFTER INSERT OR DELETE OR UPDATE OF status ON claims
+        FOR EACH ROW EXECUTE FUNCTION refloop_count_claims()
+    """)
+
+    # Seed with exact values; the triggers keep them current from here
+    cursor.execute(SEED_STATS_QUERY)
+
+    cursor.close()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Transactional outbox for user notifications
+
+Handlers insert notification rows in the same transaction as the state
+change they report (see database.OUTBOX_INSERT_QUERY); the outbox
+dispatcher delivers them in the background and marks them sent, so a
+failed send or a restart no longer loses the message.
+"""
+
+TRANSACTIONAL = True
+
+def upgrade(conn):
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id BIGSERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            method TEXT NOT NULL DEFAULT 'send_message',
+            payload JSONB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    """)
+
+    # Dispatcher queue: due pending rows, oldest first. The table is new,
+    # so a plain CREATE INDEX inside the transaction is fine.
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (available_at, id)
+        WHERE status = 'pending'
+    """)
+
+    cursor.close()
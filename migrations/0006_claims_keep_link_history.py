@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Keep claims when their referral link is deleted
+
+claims.link_id becomes nullable and its foreign key ON DELETE SET NULL,
+so retiring a full link keeps the approved claims (their rewards and
+the dashboard counters depend on them) instead of deleting them.
+
+Runs outside a transaction: the constraint is swapped NOT VALID in a
+short transaction and validated afterwards, which doesn't block writes.
+Safe to re-run.
+"""
+
+TRANSACTIONAL = False
+
+CONSTRAINT_NAME = 'claims_link_id_fkey'
+
+def _link_constraints(conn):
+    """Foreign keys from claims.link_id as {name: (on_delete, validated)}"""
+    rows = conn.execute("""
+        SELECT con.conname AS name, con.confdeltype AS on_delete, con.convalidated AS validated
+        FROM pg_constraint con
+        JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = ANY(con.conkey)
+        WHERE con.conrelid = 'claims'::regclass
+          AND con.confrelid = 'referral_links'::regclass
+          AND con.contype = 'f'
+          AND att.attname = 'link_id'
+    """).fetchall()
+    return {row['name']: (row['on_delete'], row['validated']) for row in rows}
+
+def upgrade(conn):
+    constraints = _link_constraints(conn)
+    if constraints.get(CONSTRAINT_NAME, ('', False))[0] != 'n':
+        with conn.transaction():
+            conn.execute("ALTER TABLE claims ALTER COLUMN link_id DROP NOT NULL")
+            for name in constraints:
+                conn.execute("ALTER TABLE claims DROP CONSTRAINT %s" % name)
+            conn.execute("""
+                ALTER TABLE claims
+                ADD CONSTRAINT %s FOREIGN KEY (link_id)
+                REFERENCES referral_links(id) ON DELETE SET NULL
+                NOT VALID
+            """ % CONSTRAINT_NAME)
+        constraints = _link_constraints(conn)
+
+    if not constraints[CONSTRAINT_NAME][1]:
+        conn.execute("ALTER TABLE claims VALIDATE CONSTRAINT %s" % CONSTRAINT_NAME)
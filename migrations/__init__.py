@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Versioned schema migrations for RefLoop
+
+Migrations are the NNNN_<name>.py files in this directory, applied in
+order and recorded in the schema_version table. Each file defines
+upgrade(conn) and a TRANSACTIONAL flag:
+
+- TRANSACTIONAL = True: upgrade() and the version row are committed
+  together in one transaction.
+- TRANSACTIONAL = False: upgrade() runs on the autocommit connection,
+  for CREATE INDEX CONCURRENTLY and batched backfills that must not
+  hold locks for the whole migration. Such migrations must be safe to
+  re-run if interrupted.
+"""
+
+import re
+import time
+import logging
+import importlib.util
+from pathlib import Path
+
+import psycopg
+from psycopg.rows import dict_row
+
+from database import get_database_url, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# Advisory lock key so concurrent boots don't migrate at the same time
+MIGRATION_LOCK_ID = 7_310_001
+
+# Defaults for backfill_in_batches()
+BACKFILL_BATCH_SIZE = 1000
+BACKFILL_PAUSE = 0.05
+
+def discover():
+    """List available migrations as (version, name, path), in order"""
+    found = []
+    for path in MIGRATIONS_DIR.iterdir():
+        match = MIGRATION_FILE_RE.match(path.name)
+        if match:
+            found.append((int(match.group(1)), match.group(2), path))
+    found.sort()
+    return found
+
+def latest_version():
+    """Highest migration version shipped with the code"""
+    migrations = discover()
+    return migrations[-1][0] if migrations else 0
+
+def load(version, name, path):
+    """Import a migration module from its file"""
+    spec = importlib.util.spec_from_file_location("migrations.m%04d_%s" % (version, name), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def current_version():
+    """Schema version recorded in the database (0 if never migrated)
+
+    A single query, cheap enough to run on every boot.
+    """
+    with get_db_connection() as conn:
+        try:
+            row = conn.execute("SELECT MAX(version) AS version FROM schema_version").fetchone()
+        except psycopg.errors.UndefinedTable:
+            conn.rollback()
+            return 0
+        return row['version'] or 0
+
+def is_current():
+    """True if no migration is pending"""
+    return current_version() >= latest_version()
+
+def migrate(target=None):
+    """Apply pending migrations up to target (default: latest)
+
+    Runs on a dedicated autocommit connection holding an advisory lock,
+    so a second instance booting at the same time waits and then finds
+    nothing left to do. Returns the list of applied versions.
+    """
+    applied = []
+    with psycopg.connect(get_database_url(), autocommit=True, row_factory=dict_row) as conn:
+        conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            done = {row['version'] for row in conn.execute("SELECT version FROM schema_version")}
+
+            for version, name, path in discover():
+                if version in done or (target is not None and version > target):
+                    continue
+
+                module = load(version, name, path)
+                logger.info("Applying migration %04d_%s" % (version, name))
+                started = time.monotonic()
+
+                if getattr(module, 'TRANSACTIONAL', True):
+                    with conn.transaction():
+                        module.upgrade(conn)
+                        record_version(conn, version, name)
+                else:
+                    module.upgrade(conn)
+                    record_version(conn, version, name)
+
+                logger.info("Migration %04d_%s applied in %.1fs" % (version, name, time.monotonic() - started))
+                applied.append(version)
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    return applied
+
+def record_version(conn, version, name):
+    """Mark a migration as applied"""
+    conn.execute("""
+        INSERT INTO schema_version (version, name)
+        VALUES (%s, %s)
+        ON CONFLICT (version) DO NOTHING
+    """, (version, name))
+
+# Helpers for online-safe (TRANSACTIONAL = False) migrations
+
+def create_indexes_concurrently(conn, indexes):
+    """Create indexes {name: definition} without blocking writes
+
+    Invalid leftovers from an interrupted concurrent build are dropped
+    and rebuilt. conn must be in autocommit mode.
+    """
+    rows = conn.execute("""
+        SELECT c.relname AS name, i.indisvalid AS valid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY(%s)
+    """, (list(indexes),)).fetchall()
+    existing = {row['name']: row['valid'] for row in rows}
+
+    for name, definition in indexes.items():
+        if existing.get(name):
+            continue
+        if name in existing:
+            logger.warning("Rebuilding invalid index %s" % name)
+            conn.execute("DROP INDEX CONCURRENTLY IF EXISTS %s" % name)
+        logger.info("Creating index %s" % name)
+        conn.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS %s %s" % (name, definition))
+
+def backfill_in_batches(conn, statement, params=None, batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE):
+    """Run an UPDATE/INSERT/DELETE repeatedly in small committed batches
+
+    statement must limit itself with %(batch_size)s and only touch rows
+    that still need work, e.g.
+
+        UPDATE t SET x = ... WHERE id IN (
+            SELECT id FROM t WHERE x IS NULL LIMIT %(batch_size)s
+        )
+
+    Each batch commits on its own (conn must be in autocommit mode) so
+    row locks are held briefly and live traffic keeps flowing. Returns
+    the total number of rows affected.
+    """
+    total = 0
+    while True:
+        cursor = conn.execute(statement, dict(params or {}, batch_size=batch_size))
+        total += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return total
+        time.sleep(pause)
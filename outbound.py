@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""Rate-limited outbound message queue for RefLoop Bot
+
+Bot-initiated messages (notifications to referrers, admins and users)
+go through a single queue that respects Telegram's limits: about 30
+messages per second overall and 1 message per second per chat.
+RetryAfter pauses sending for the time Telegram asks, transient network
+errors are retried with exponential backoff, and other errors fail the
+message. Direct replies to the user's own update don't need the queue.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+
+from telegram.error import RetryAfter, NetworkError, BadRequest
+
+logger = logging.getLogger(__name__)
+
+class OutboundJob:
+    """One queued Bot API call"""
+
+    __slots__ = ('bot', 'method', 'kwargs', 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, bot, method, kwargs, future):
+        self.bot = bot
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+def _consume_result(future):
+    # Failures are logged by the queue; don't warn about unawaited futures
+    if not future.cancelled():
+        future.exception()
+
+class OutboundQueue:
+    """Global and per-chat rate limited sender
+
+    send_message()/send_photo() enqueue and return an asyncio.Future with
+    the Bot API result; callers may await it or fire and forget.
+    Messages to the same chat are delivered in order.
+    """
+
+    def __init__(self):
+        self.global_rate = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+        self.per_chat_interval = float(os.getenv('OUTBOUND_PER_CHAT_INTERVAL', '1'))
+        self.max_retries = int(os.getenv('OUTBOUND_MAX_RETRIES', '5'))
+        self.backoff_base = float(os.getenv('OUTBOUND_BACKOFF_BASE', '1'))
+        self.backoff_max = 60.0
+
+        self._chats = {}
+        self._chat_next = {}
+        self._scheduled = set()
+        self._ready = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._deliveries = set()
+        self._token_time = time.monotonic()
+        self._paused_until = 0.0
+
+        self._depth = 0
+        self._in_flight = 0
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+        self._latencies = deque(maxlen=500)
+        self._send_times = deque(maxlen=500)
+
+    @property
+    def global_rate(self):
+        """Messages per second across all chats (also the burst size)"""
+        return self._global_rate
+
+    @global_rate.setter
+    def global_rate(self, rate):
+        # Cap the bucket too, so lowering the rate doesn't leave a burst
+        # sized for the old one
+        self._global_rate = rate
+        self._tokens = min(getattr(self, '_tokens', rate), rate)
+
+    def send_message(self, bot, chat_id, **kwargs):
+        """Queue bot.send_message(chat_id=..., **kwargs)"""
+        return self.enqueue(bot, 'send_message', chat_id=chat_id, **kwargs)
+
+    def send_photo(self, bot, chat_id, **kwargs):
+        """Queue bot.send_photo(chat_id=..., **kwargs)"""
+        return self.enqueue(bot, 'send_photo', chat_id=chat_id, **kwargs)
+
+    def enqueue(self, bot, method, **kwargs):
+        """Queue any Bot API method that takes a chat_id"""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_result)
+        chat_id = kwargs['chat_id']
+        self._chats.setdefault(chat_id, deque()).append(OutboundJob(bot, method, kwargs, future))
+        self._depth += 1
+        if chat_id not in self._scheduled:
+            self._schedule(chat_id, max(time.monotonic(), self._chat_next.get(chat_id, 0.0)))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        return future
+
+    def stats(self):
+        """Queue depth, delivery counters and latency figures"""
+        latencies = sorted(self._latencies)
+        send_times = self._send_times
+        return {
+            'queue_depth': self._depth,
+            'in_flight': self._in_flight,
+            'sent': self._sent,
+            'failed': self._failed,
+            'retried': self._retried,
+            'latency_avg_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95_ms': 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+            'send_avg_ms': 1000 * sum(send_times) / len(send_times) if send_times else 0.0,
+        }
+
+    def log_stats(self):
+        """Log queue depth, delivery counters and latencies"""
+        stats = self.stats()
+        logger.info(
+            "Outbound queue: depth=%d in_flight=%d sent=%d failed=%d retried=%d "
+            "latency avg=%.0fms p95=%.0fms send avg=%.0fms" % (
+                stats['queue_depth'], stats['in_flight'], stats['sent'], stats['failed'], stats['retried'],
+                stats['latency_avg_ms'], stats['latency_p95_ms'], stats['send_avg_ms']
+            )
+        )
+
+    def pending(self):
+        """Messages queued or being sent"""
+        return self._depth + self._in_flight
+
+    async def drain(self, timeout: float):
+        """Wait up to timeout seconds for the queue to empty; True if it did"""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self.pending()
+
+    async def stop(self, timeout: float = 0):
+        """Drain for up to timeout seconds, then drop what is left
+
+        Sends still in flight at the deadline are cancelled and awaited,
+        so none outlive the bot's connection. Returns the number of
+        abandoned messages.
+        """
+        if timeout:
+            await self.drain(timeout)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        abandoned = len(self._deliveries)
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+        for jobs in self._chats.values():
+            while jobs:
+                job = jobs.popleft()
+                job.future.cancel()
+                abandoned += 1
+        self._depth = 0
+        self._chats.clear()
+        self._scheduled.clear()
+        self._ready.clear()
+        return abandoned
+
+    def _schedule(self, chat_id, when):
+        self._scheduled.add(chat_id)
+        self._seq += 1
+        heapq.heappush(self._ready, (when, self._seq, chat_id))
+        self._wakeup.set()
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.global_rate, self._tokens + (now - self._token_time) * self.global_rate)
+            self._token_time = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.global_rate)
+
+    async def _dispatch(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            when, _, chat_id = self._ready[0]
+            delay = max(when, self._paused_until) - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._take_token()
+            if not self._ready or self._ready[0][0] > time.monotonic():
+                # Something not yet due got ahead while we waited; refund
+                self._tokens += 1
+                continue
+            _, _, chat_id = heapq.heappop(self._ready)
+            jobs = self._chats.get(chat_id)
+            if not jobs:
+                self._scheduled.discard(chat_id)
+                continue
+            job = jobs.popleft()
+            self._depth -= 1
+            if job.future.cancelled():
+                # The caller gave up waiting; drop it unsent
+                self._tokens += 1
+                if jobs:
+                    self._schedule(chat_id, self._chat_next.get(chat_id, 0.0))
+                else:
+                    self._scheduled.discard(chat_id)
+                    self._chats.pop(chat_id, None)
+                continue
+            self._in_flight += 1
+            task = asyncio.create_task(self._deliver(chat_id, job))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, chat_id, job):
+        retry_in = None
+        started = time.monotonic()
+        try:
+            job.attempts += 1
+            result = await getattr(job.bot, job.method)(**job.kwargs)
+        except asyncio.CancelledError:
+            # Cancelled by stop(): the message is abandoned
+            job.future.cancel()
+            raise
+        except RetryAfter as e:
+            retry_in = e.retry_after
+            if isinstance(retry_in, timedelta):
+                retry_in = retry_in.total_seconds()
+            # Flood control applies to the whole bot, not just this chat
+            self._paused_until = time.monotonic() + retry_in
+            logger.warning("Flood limit hit, pausing outbound messages for %ss" % retry_in)
+        except BadRequest as e:
+            # A NetworkError subclass, but retrying won't help
+            self._failed += 1
+            logger.error("Failed to send %s to %s: %s" % (job.method, chat_id, e))
+            if not job.future.done():
+                job.future.set_exception(e)
+        except NetworkError as e:
+            if job.attempts <= self.max_retries:
+                retry_in = min(self.backoff_max, self.backoff_base * 2 ** (job.attempts - 1))
+                logger.warning("Send to %s failed (%s), retry %d in %.1fs" % (chat_id, e, job.attempts, retry_in))
+            else:
+                self._failed += 1
+                logger.error("Giving up on message to %s after %d attempts: %s" % (chat_id, job.attempts, e))
+                if not job.future.done():
+                    job.future.set_exception(e)
+        except Exception as e:
+            self._failed += 1
+            logger.error("Failed to send %s to %s: %s" % (job.method, chat_id, e))
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            now = time.monotonic()
+            self._sent += 1
+            self._send_times.append(now - started)
+            self._latencies.append(now - job.enqueued_at)
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight -= 1
+
+        jobs = self._chats.get(chat_id)
+        if retry_in is not None:
+            self._retried += 1
+            if jobs is None:
+                jobs = self._chats[chat_id] = deque()
+            jobs.appendleft(job)
+            self._depth += 1
+            self._chat_next[chat_id] = time.monotonic() + retry_in
+        else:
+            self._chat_next[chat_id] = started + self.per_chat_interval
+
+        if jobs:
+            self._schedule(chat_id, self._chat_next[chat_id])
+        else:
+            self._scheduled.discard(chat_id)
+            self._chats.pop(chat_id, None)
+            self._prune_chat_next()
+
+    def _prune_chat_next(self):
+        if len(self._chat_next) > 10000:
+            now = time.monotonic()
+            for chat_id in [c for c, t in self._chat_next.items() if t < now]:
+                del self._chat_next[chat_id]
+
+# Process-wide queue used by the handlers
+outbound = OutboundQueue()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Outbox dispatcher for RefLoop Bot
+
+Notifications are written to the outbox table in the same transaction
+as the change they report. The dispatcher leases due rows (FOR UPDATE
+SKIP LOCKED in a short transaction), sends them through the rate-limited
+outbound queue with no transaction open and marks them sent,
+rescheduled or failed. It polls every OUTBOX_POLL_INTERVAL seconds and
+can be woken right after a handler commits new rows.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from telegram.error import BadRequest, Forbidden
+
+import database_async as adb
+from outbound import outbound
+
+logger = logging.getLogger(__name__)
+
+class OutboxDispatcher:
+    """Background delivery of outbox rows"""
+
+    def __init__(self):
+        self.poll_interval = float(os.getenv('OUTBOX_POLL_INTERVAL', '1'))
+        self.batch_size = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+        self.max_attempts = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+        self.retry_delay = float(os.getenv('OUTBOX_RETRY_DELAY', '5'))
+        self.send_timeout = float(os.getenv('OUTBOX_SEND_TIMEOUT', '60'))
+        self.retention = float(os.getenv('OUTBOX_RETENTION', str(7 * 86400)))
+        self.cleanup_interval = 3600.0
+        # Leases outlive a batch's send timeout, so rows aren't re-leased mid-send
+        self.lease_margin = 30.0
+        self._bot = None
+        self._task = None
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+
+    def start(self, bot):
+        """Start delivering with the given bot"""
+        self._bot = bot
+        self._stopping = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 0):
+        """Stop the dispatcher; undelivered rows stay pending in the table
+
+        Waits up to timeout seconds for the batch in progress to finish
+        before cancelling it.
+        """
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+
+    def wake(self):
+        """Deliver newly committed rows without waiting for the next poll"""
+        self._wakeup.set()
+
+    async def _deliver(self, rows):
+        futures = {
+            row['id']: outbound.enqueue(self._bot, row['method'], chat_id=row['chat_id'], **row['payload'])
+            for row in rows
+        }
+        try:
+            done, pending = await asyncio.wait(futures.values(), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            # The rows are retried once their lease runs out; don't let
+            # the queue send them too
+            for future in futures.values():
+                future.cancel()
+            raise
+        for future in pending:
+            # Dropped unsent by the queue; the row is retried later
+            future.cancel()
+
+        results = {}
+        for row_id, future in futures.items():
+            if future.cancelled():
+                results[row_id] = ("timed out in outbound queue", True)
+            elif future.exception() is not None:
+                error = future.exception()
+                results[row_id] = (error, not isinstance(error, (BadRequest, Forbidden)))
+            else:
+                results[row_id] = None
+        return results
+
+    async def _run(self):
+        next_cleanup = time.monotonic() + self.cleanup_interval
+        while not self._stopping:
+            handled = 0
+            try:
+                handled = await adb.process_outbox(
+                    self._deliver, self.batch_size, self.max_attempts, self.retry_delay,
+                    self.send_timeout + self.lease_margin
+                )
+                if time.monotonic() >= next_cleanup:
+                    next_cleanup = time.monotonic() + self.cleanup_interval
+                    deleted = await adb.delete_old_outbox(self.retention, 500)
+                    if deleted:
+                        logger.info("Deleted %d old outbox rows" % deleted)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Outbox dispatch failed: %s" % str(e))
+
+            if handled < self.batch_size and not self._stopping:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+# Process-wide dispatcher started by the bot
+outbox = OutboxDispatcher()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Submission draft store for the submit-link flow
+
+Drafts live in memory keyed by user and are written to the
+submission_state table behind the handlers' backs: a draft is flushed
+once it has been idle for SUBMISSION_FLUSH_DELAY seconds, or right away
+when a step asks for it (before the final step, so the data needed to
+create the link survives a restart). Drafts untouched for
+SUBMISSION_TTL seconds expire, and a periodic sweep deletes stale rows
+in small batches.
+
+When several webhook workers share the load a user's next update may
+reach another worker, so a shared store skips the memory copy: fetch()
+reads the row and update() merges into it straight away. A single
+process, or a polling leader, keeps the in-memory fast path.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+import database_async as adb
+
+logger = logging.getLogger(__name__)
+
+# Fields kept per draft, matching the submission_state columns
+DRAFT_FIELDS = ('state', 'plan', 'category', 'service_name', 'url', 'description', 'max_claims')
+
+class SubmissionStore:
+    """In-memory submission drafts with write-behind persistence"""
+
+    def __init__(self, shared: bool = False):
+        self.shared = shared
+        self.flush_delay = float(os.getenv('SUBMISSION_FLUSH_DELAY', '2'))
+        self.ttl = float(os.getenv('SUBMISSION_TTL', '86400'))
+        self.sweep_interval = float(os.getenv('SUBMISSION_SWEEP_INTERVAL', '600'))
+        self.sweep_batch = int(os.getenv('SUBMISSION_SWEEP_BATCH', '500'))
+        self._drafts = {}
+        self._touched = {}
+        self._dirty = set()
+        self._io_lock = asyncio.Lock()
+        self._task = None
+
+    async def start(self):
+        """Load persisted drafts and start the flush/sweep loop"""
+        if self.shared:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Submission store is shared: reading and writing through")
+            return
+        rows = await adb.load_submission_states(self.ttl)
+        now = time.monotonic()
+        for row in rows:
+            self._drafts[row['user_id']] = {field: row[field] for field in DRAFT_FIELDS}
+            self._touched[row['user_id']] = now - float(row['age'])
+        self._task = asyncio.create_task(self._run())
+        logger.info("Submission store loaded %d active drafts" % len(rows))
+
+    async def stop(self):
+        """Stop the background loop and flush everything still pending
+
+        Returns the number of drafts written.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        return await self.flush(force=True)
+
+    def get(self, user_id: int):
+        """Current draft for a user (a copy), or None"""
+        draft = self._drafts.get(user_id)
+        if draft is None:
+            return None
+        if time.monotonic() - self._touched[user_id] > self.ttl:
+            self._forget(user_id)
+            return None
+        return dict(draft, user_id=user_id)
+
+    async def fetch(self, user_id: int):
+        """Current draft for a user, read from the database when shared"""
+        if not self.shared:
+            return self.get(user_id)
+        row = await adb.load_submission_state(user_id, self.ttl)
+        if row is None:
+            return None
+        return dict({field: row[field] for field in DRAFT_FIELDS}, user_id=user_id)
+
+    async def update(self, user_id: int, flush: bool = False, **fields):
+        """Merge non-None fields into the user's draft
+
+        With flush=True (always, when shared) the draft is persisted
+        before returning.
+        """
+        for field in fields:
+            if field not in DRAFT_FIELDS:
+                raise ValueError("Unknown submission field: %s" % field)
+        if self.shared:
+            await adb.save_submission_state(user_id, **fields)
+            return
+        draft = self._drafts.setdefault(user_id, dict.fromkeys(DRAFT_FIELDS))
+        for field, value in fields.items():
+            if value is not None:
+                draft[field] = value
+        self._touched[user_id] = time.monotonic()
+        self._dirty.add(user_id)
+        if flush:
+            await self.flush(user_ids=[user_id])
+
+    async def clear(self, user_id: int):
+        """Drop a user's draft, in memory and in the database"""
+        if user_id not in self._drafts and not self.shared:
+            return
+        self._forget(user_id)
+        async with self._io_lock:
+            await adb.clear_submission_state(user_id)
+
+    async def flush(self, user_ids=None, force: bool = False):
+        """Persist dirty drafts in one batch
+
+        By default only drafts idle for at least flush_delay are written;
+        pass user_ids or force=True to write immediately.
+        """
+        async with self._io_lock:
+            now = time.monotonic()
+            if user_ids is not None:
+                pending = [uid for uid in user_ids if uid in self._dirty]
+            elif force:
+                pending = list(self._dirty)
+            else:
+                pending = [uid for uid in self._dirty if now - self._touched[uid] >= self.flush_delay]
+            rows = [dict(self._drafts[uid], user_id=uid) for uid in pending if uid in self._drafts]
+            if not rows:
+                return 0
+            self._dirty.difference_update(pending)
+            try:
+                await adb.upsert_submission_states(rows)
+            except Exception:
+                # Keep them dirty so the next flush retries
+                self._dirty.update(row['user_id'] for row in rows)
+                raise
+            return len(rows)
+
+    async def sweep(self):
+        """Expire stale drafts in memory and delete stale rows in batches"""
+        now = time.monotonic()
+        for user_id in [uid for uid, touched in self._touched.items() if now - touched > self.ttl]:
+            self._forget(user_id)
+        async with self._io_lock:
+            deleted = await adb.delete_stale_submission_states(self.ttl, self.sweep_batch)
+        if deleted:
+            logger.info("Expired %d stale submission drafts" % deleted)
+        return deleted
+
+    def _forget(self, user_id: int):
+        self._drafts.pop(user_id, None)
+        self._touched.pop(user_id, None)
+        self._dirty.discard(user_id)
+
+    async def _run(self):
+        next_sweep = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_delay)
+            try:
+                await self.flush()
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + self.sweep_interval
+                    await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Submission store maintenance failed: %s" % str(e))
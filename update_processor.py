@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Concurrent update processing with per-user ordering
+
+PTB processes updates one at a time by default, so one slow handler
+holds up every other user. PerUserUpdateProcessor lets up to
+max_concurrent_updates run at once while updates from the same user
+(or chat, when there is no user) still run one after another, in
+arrival order, so multi-step flows like submitting a link are applied
+in order. A user's later updates wait in a queue rather than in a
+global slot, so one user with a backlog can't starve the others.
+
+For shutdown, drain() waits for running and queued updates to finish
+and abandon() cancels what is still running and skips the rest.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Global concurrency limit plus per-user serialisation"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._users = {}
+        self._pending = 0
+        self._running = set()
+        self._abandoned = set()
+        self._closing = False
+
+    @staticmethod
+    def serialization_key(update):
+        """The user (or chat) whose updates must not overlap, or None"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return ('user', user.id)
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return ('chat', chat.id)
+        return None
+
+    def active_users(self):
+        """Users with an update running or waiting"""
+        return len(self._users)
+
+    def pending(self):
+        """Updates running or queued behind their user's running update
+
+        Updates still waiting for a global slot aren't counted;
+        Application.stop() waits for those, and after abandon() they are
+        skipped as soon as they get a slot.
+        """
+        return self._pending
+
+    async def drain(self, timeout: float):
+        """Wait up to timeout seconds for all updates to finish; True if they did"""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self._pending
+
+    def abandon(self):
+        """Cancel running handlers and skip waiting updates
+
+        Returns the number of updates affected.
+        """
+        self._closing = True
+        for task in self._running:
+            self._abandoned.add(task)
+            task.cancel()
+        return self._pending
+
+    async def do_process_update(self, update, coroutine):
+        # PTB calls this holding one of the max_concurrent_updates slots
+        # (process_update itself is final). If the user already has an
+        # update running, this one is queued behind it and the slot is
+        # given back at once; the running update then works through its
+        # user's queue in order. A user with a backlog so holds one slot.
+        self._pending += 1
+        key = self.serialization_key(update)
+        if key is None:
+            try:
+                await self._run(update, coroutine)
+            finally:
+                self._pending -= 1
+            return
+
+        queue = self._users.get(key)
+        if queue is not None:
+            queue.append((update, coroutine))
+            return
+
+        queue = self._users[key] = deque()
+        try:
+            while True:
+                try:
+                    await self._run(update, coroutine)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # Don't let one failure drop the user's queued updates
+                    logger.exception("Update %s failed" % update.update_id)
+                finally:
+                    self._pending -= 1
+                if not queue:
+                    break
+                update, coroutine = queue.popleft()
+        finally:
+            del self._users[key]
+            # Only left over if this task was cancelled
+            while queue:
+                update, coroutine = queue.popleft()
+                coroutine.close()
+                self._pending -= 1
+                logger.warning("Dropped update %s: its user's runner was cancelled" % update.update_id)
+
+    async def _run(self, update, coroutine):
+        if self._closing:
+            coroutine.close()
+            logger.warning("Skipped update %s: shutting down" % update.update_id)
+            return
+        # Run the handler as its own task so abandon() can cancel it
+        # without cancelling PTB's wrapper task
+        task = asyncio.create_task(coroutine)
+        self._running.add(task)
+        try:
+            await task
+        except asyncio.CancelledError:
+            if task not in self._abandoned:
+                raise
+            logger.warning("Abandoned update %s: shutdown deadline reached" % update.update_id)
+        finally:
+            self._running.discard(task)
+            self._abandoned.discard(task)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
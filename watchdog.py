@@ -1,9 +1,30 @@
 # -*- coding: utf-8 -*-
-import subprocess
+"""
+Bot watchdog
+Runs WORKER_COUNT bot.py processes and restarts each one when it exits
+or stops answering health checks. Output is read asynchronously, so a
+quiet bot is not mistaken for a dead one, and liveness is probed every
+HEALTH_CHECK_INTERVAL seconds through the heartbeat file each worker
+touches (and HEALTH_CHECK_URL, when set for a single worker). Every
+worker has its own backoff and restart accounting.
+
+With WARM_STANDBY each worker also keeps a pre-initialised standby
+child waiting for a "GO <id>" line on stdin. When the active process
+dies the standby is promoted at once, without the restart backoff, and
+the time until it reports SERVING is logged as the failover time.
+
+Signals: SIGTERM/SIGINT stop all workers gracefully, SIGHUP restarts
+them one at a time (each must be healthy again before the next), and
+SIGUSR1 logs the status of all workers.
+"""
+import os
+import sys
 import time
+import signal
+import asyncio
 import logging
-import sys
 from datetime import datetime
+import aiohttp
 import watchdog_config as config
 
 logging.basicConfig(
@@ -16,76 +37,414 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_bot():
-    """Run the bot process and monitor it"""
-    restart_count = 0
-    restart_times = []
-    
-    while True:
+class Child:
+    """A bot process and the READY/SERVING markers it prints"""
+
+    def __init__(self, process, label: str):
+        self.process = process
+        self.label = label
+        self.ready = asyncio.Event()
+        self.serving = asyncio.Event()
+        self.output = asyncio.create_task(self._pump())
+
+    @property
+    def alive(self):
+        return self.process.returncode is None
+
+    async def _pump(self):
+        """Echo the child's output as it arrives"""
+        async for raw in self.process.stdout:
+            line = raw.decode(errors='replace').rstrip()
+            if line == 'READY':
+                self.ready.set()
+                continue
+            if line.startswith('SERVING'):
+                self.serving.set()
+                continue
+            print(line, flush=True)
+            if config.VERBOSE_LOGGING:
+                logger.info("%s: %s" % ('BOT' if self.label == 'bot' else self.label, line))
+
+    async def promote(self, promotion_id: int):
+        """Tell a waiting standby to start serving"""
+        self.process.stdin.write(("GO %d\n" % promotion_id).encode())
+        await self.process.stdin.drain()
+
+    async def kill(self, grace: float):
+        """SIGTERM, then SIGKILL if the process hasn't exited in time"""
+        if self.alive:
+            try:
+                self.process.terminate()
+            except ProcessLookupError:
+                pass
+            try:
+                await asyncio.wait_for(self.process.wait(), grace)
+            except asyncio.TimeoutError:
+                logger.warning("%s did not stop within %ds - killing it" % (self.label, grace))
+                self.process.kill()
+                await self.process.wait()
+        await self.output
+
+class Worker:
+    """One supervised bot process with its own restart accounting"""
+
+    def __init__(self, index: int = 0, count: int = 1):
+        self.index = index
+        self.count = count
+        if count > 1:
+            self.name = 'worker-%d' % index
+            root, ext = os.path.splitext(config.HEARTBEAT_FILE)
+            self.heartbeat_file = '%s-%d%s' % (root, index, ext)
+            # One shared port: an HTTP probe can't target this worker
+            self.health_url = None
+        else:
+            self.name = 'bot'
+            self.heartbeat_file = config.HEARTBEAT_FILE
+            self.health_url = config.HEALTH_CHECK_URL
+        self.child = None
+        self.standby = None
+        self.promotions = 0
+        self.died_at = None
+        self.last_failover = None
+        self.started_at = None
+        self.restart_count = 0
+        self.restart_times = []
+        self.standby_failures = 0
+        self.standby_restart_times = []
+        self.standby_retry_at = 0.0
+        self.failover_task = None
+        self.failed_checks = 0
+        self.last_exit_code = None
+        self.restart_requested = False
+        self.status = 'starting'
+
+    @property
+    def process(self):
+        return self.child.process if self.child else None
+
+    def standby_ready(self):
+        return self.standby is not None and self.standby.alive and self.standby.ready.is_set()
+
+    def child_env(self):
+        env = dict(os.environ)
+        env['WATCHDOG_PROTOCOL'] = '1'
+        env['HEARTBEAT_FILE'] = self.heartbeat_file
+        env['HEARTBEAT_INTERVAL'] = str(config.HEARTBEAT_INTERVAL)
+        env['WORKER_ID'] = str(self.index)
+        env['WORKER_COUNT'] = str(self.count)
+        return env
+
+    def describe(self):
+        """One-line status for the aggregate report"""
+        if self.status == 'running' and self.process:
+            line = "%s: running (pid %d, up %ds, restarts %d)" % (
+                self.name, self.process.pid, time.monotonic() - self.started_at, self.restart_count
+            )
+        else:
+            line = "%s: %s (restarts %d, last exit %s)" % (
+                self.name, self.status, self.restart_count, self.last_exit_code
+            )
+        if config.WARM_STANDBY:
+            if self.standby_ready():
+                line += ", standby ready"
+            elif self.standby is not None:
+                line += ", standby warming up"
+            else:
+                line += ", standby backing off (%d failures)" % self.standby_failures
+        if self.last_failover is not None:
+            line += ", last failover %.0fms" % (1000 * self.last_failover)
+        return line
+
+    async def spawn(self, standby: bool = False):
+        """Start a bot process; a standby warms up and waits for GO"""
+        env = self.child_env()
+        if standby:
+            env['BOT_STANDBY'] = '1'
+        process = await asyncio.create_subprocess_exec(
+            *config.BOT_COMMAND,
+            stdin=asyncio.subprocess.PIPE if standby else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env
+        )
+        return Child(process, self.name + ' standby' if standby else self.name)
+
+    async def discard_standby(self):
+        standby, self.standby = self.standby, None
+        if standby:
+            await standby.kill(config.STOP_GRACE_PERIOD)
+
+    async def reap_standby(self):
+        """Discard a standby that has died and schedule its replacement
+
+        Deaths get the same backoff and hourly cap as the active process,
+        so a standby that can't boot isn't respawned every check.
+        """
+        if self.standby is None or self.standby.alive:
+            return
+        code = self.standby.process.returncode
+        await self.discard_standby()
+        self.standby_failures += 1
+        wait_time = self.next_wait(self.standby_restart_times, self.standby_failures, self.name + ' standby')
+        self.standby_retry_at = time.monotonic() + wait_time
+        logger.warning("%s standby exited with code %s - replacing it in %d seconds" % (self.name, code, wait_time))
+
+    async def ensure_standby(self):
+        """Keep a standby warming up unless its replacement is backing off"""
+        if not config.WARM_STANDBY:
+            return
+        await self.reap_standby()
+        if self.standby is not None:
+            if self.standby.ready.is_set():
+                self.standby_failures = 0
+            return
+        if time.monotonic() >= self.standby_retry_at:
+            self.standby = await self.spawn(standby=True)
+
+    async def start(self):
+        """Promote the standby if one is ready, else start a fresh process"""
         try:
+            os.remove(self.heartbeat_file)
+        except FileNotFoundError:
+            pass
+
+        if self.standby_ready():
+            self.child, self.standby = self.standby, None
+            self.child.label = self.name
+            self.promotions += 1
+            logger.info("Promoting warm standby for %s (pid %d)" % (self.name, self.child.process.pid))
+            await self.child.promote(self.promotions)
+            promoted = True
+        else:
             logger.info("=" * 70)
-            logger.info("Starting bot process (restart #%d)" % (restart_count + 1))
+            logger.info("Starting %s process (restart #%d)" % (self.name, self.restart_count + 1))
             logger.info("=" * 70)
-            
-            # Start the bot process
-            process = subprocess.Popen(
-                ['python3', 'bot.py'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-            
-            # Monitor the process output
-            while True:
-                line = process.stdout.readline()
-                if line:
-                    print(line.rstrip())
-                    if config.VERBOSE_LOGGING:
-                        logger.info("BOT: %s" % line.rstrip())
-                
-                # Check if process is still running
-                if process.poll() is not None:
-                    exit_code = process.returncode
-                    logger.warning("Bot process exited with code %d" % exit_code)
-                    break
-            
-            # Process crashed, prepare for restart
-            restart_count += 1
-            restart_times.append(datetime.now())
-            
-            # Clean up old restart times (older than 1 hour)
-            restart_times = [t for t in restart_times if (datetime.now() - t).total_seconds() < 3600]
-            
-            # Check if we're restarting too frequently
-            if len(restart_times) > config.MAX_RESTARTS_PER_HOUR:
-                logger.error("Too many restarts (%d) in the last hour!" % len(restart_times))
-                logger.error("Waiting 5 minutes before next restart attempt...")
-                time.sleep(300)
-            else:
-                # Calculate wait time with exponential backoff
-                wait_time = min(
-                    config.MAX_RESTART_WAIT,
-                    config.INITIAL_RESTART_WAIT * (config.BACKOFF_MULTIPLIER ** (restart_count - 1))
-                )
-                wait_time = int(wait_time)
-                logger.info("Waiting %d seconds before restart..." % wait_time)
-                time.sleep(wait_time)
-        
-        except KeyboardInterrupt:
-            logger.info("Watchdog interrupted by user")
-            if 'process' in locals():
-                process.terminate()
-            break
-        except Exception as e:
-            logger.error("Watchdog error: %s" % str(e), exc_info=True)
-            time.sleep(10)
+            await self.reap_standby()
+            self.child = await self.spawn()
+            promoted = False
+
+        self.started_at = time.monotonic()
+        self.failed_checks = 0
+        self.status = 'running'
+
+        if self.died_at is not None:
+            if self.failover_task:
+                self.failover_task.cancel()
+            self.failover_task = asyncio.create_task(self.report_failover(self.child, self.died_at, promoted))
+        await self.ensure_standby()
+
+    async def report_failover(self, child, died_at: float, promoted: bool):
+        """Log how long the bot was without a serving process"""
+        try:
+            await asyncio.wait_for(child.serving.wait(), config.HEALTH_CHECK_START_PERIOD)
+        except asyncio.TimeoutError:
+            logger.warning("%s did not report SERVING within %ds" % (self.name, config.HEALTH_CHECK_START_PERIOD))
+            return
+        self.last_failover = time.monotonic() - died_at
+        logger.info("%s failover took %.0fms (%s)" % (
+            self.name, 1000 * self.last_failover, 'warm standby' if promoted else 'cold start'
+        ))
+
+    async def probe(self, session):
+        """One liveness check; returns None if healthy, else the reason"""
+        try:
+            age = time.time() - os.path.getmtime(self.heartbeat_file)
+        except FileNotFoundError:
+            return "no heartbeat yet"
+        if age > config.HEARTBEAT_INTERVAL + config.HEALTH_CHECK_TIMEOUT:
+            return "heartbeat is %.0fs old" % age
+
+        if self.health_url:
+            try:
+                timeout = aiohttp.ClientTimeout(total=config.HEALTH_CHECK_TIMEOUT)
+                async with session.get(self.health_url, timeout=timeout) as response:
+                    if response.status != 200:
+                        return "%s returned %d" % (self.health_url, response.status)
+            except Exception as e:
+                return "%s failed: %s" % (self.health_url, str(e) or e.__class__.__name__)
+        return None
+
+    async def monitor_health(self, session):
+        """Probe periodically; returns once the bot should be restarted"""
+        while True:
+            await asyncio.sleep(config.HEALTH_CHECK_INTERVAL)
+            await self.ensure_standby()
+
+            problem = await self.probe(session)
+            if problem is None:
+                if self.failed_checks:
+                    logger.info("%s health check recovered" % self.name)
+                self.failed_checks = 0
+                continue
+
+            if time.monotonic() - self.started_at < config.HEALTH_CHECK_START_PERIOD:
+                continue
+            self.failed_checks += 1
+            logger.warning("%s health check failed (%d/%d): %s" % (
+                self.name, self.failed_checks, config.HEALTH_CHECK_FAILURES, problem
+            ))
+            if self.failed_checks >= config.HEALTH_CHECK_FAILURES:
+                logger.error("%s is unresponsive - restarting it" % self.name)
+                self.status = 'unhealthy'
+                return
+
+    async def stop(self, grace: float = None):
+        """SIGTERM the child, then SIGKILL it if it hasn't exited in time"""
+        if self.child is None or not self.child.alive:
+            return
+        self.status = 'stopping'
+        await self.child.kill(config.STOP_GRACE_PERIOD if grace is None else grace)
+
+    async def shutdown(self):
+        """Stop the active process and the standby"""
+        if self.failover_task:
+            self.failover_task.cancel()
+            self.failover_task = None
+        await asyncio.gather(self.stop(), self.discard_standby())
+
+    async def run_once(self, session):
+        """Run the child until it exits or fails its health checks"""
+        await self.start()
+        exited = asyncio.create_task(self.process.wait())
+        health = asyncio.create_task(self.monitor_health(session))
+        try:
+            await asyncio.wait({exited, health}, return_when=asyncio.FIRST_COMPLETED)
+            self.died_at = time.monotonic()
+        finally:
+            health.cancel()
+            await self.stop()
+        self.last_exit_code = self.process.returncode
+        logger.warning("%s process exited with code %d" % (self.name, self.last_exit_code))
+
+    async def restart(self):
+        """Gracefully restart the child without counting it as a crash
+
+        The standby is replaced too, so both pick up new code.
+        """
+        self.restart_requested = True
+        await self.discard_standby()
+        await self.stop()
+
+    async def wait_healthy(self, timeout: float):
+        """Wait until the (re)started child passes a health check"""
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                if self.status == 'running' and await self.probe(session) is None:
+                    return True
+                await asyncio.sleep(1)
+        return False
+
+    def backoff(self):
+        """Seconds to wait before the next restart"""
+        self.restart_count += 1
+        return self.next_wait(self.restart_times, self.restart_count, self.name)
+
+    @staticmethod
+    def next_wait(restart_times, attempt: int, label: str):
+        """Record a restart in restart_times and return the backoff for it"""
+        now = datetime.now()
+        restart_times.append(now)
+
+        # Clean up old restart times (older than 1 hour)
+        restart_times[:] = [t for t in restart_times if (now - t).total_seconds() < 3600]
+
+        # Check if we're restarting too frequently
+        if len(restart_times) > config.MAX_RESTARTS_PER_HOUR:
+            logger.error("Too many %s restarts (%d) in the last hour!" % (label, len(restart_times)))
+            logger.error("Waiting 5 minutes before next restart attempt...")
+            return 300
+
+        # Calculate wait time with exponential backoff
+        return int(min(
+            config.MAX_RESTART_WAIT,
+            config.INITIAL_RESTART_WAIT * (config.BACKOFF_MULTIPLIER ** (attempt - 1))
+        ))
+
+    async def supervise(self, session):
+        """Keep the bot running until cancelled"""
+        while True:
+            try:
+                await self.run_once(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Watchdog error: %s" % str(e), exc_info=True)
+
+            if self.restart_requested:
+                self.restart_requested = False
+                continue
+
+            wait_time = self.backoff()
+            if self.standby_ready() and len(self.restart_times) <= config.MAX_RESTARTS_PER_HOUR:
+                continue
+            self.status = 'backoff'
+            logger.info("Waiting %d seconds before restart..." % wait_time)
+            await asyncio.sleep(wait_time)
+
+async def rolling_restart(workers):
+    """Restart workers one at a time, waiting for each to be healthy"""
+    logger.info("Rolling restart of %d worker(s)" % len(workers))
+    for worker in workers:
+        started = time.monotonic()
+        await worker.restart()
+        if await worker.wait_healthy(config.HEALTH_CHECK_START_PERIOD):
+            logger.info("%s back up in %.1fs" % (worker.name, time.monotonic() - started))
+        else:
+            logger.error("%s not healthy after restart - stopping the rolling restart" % worker.name)
+            return
+    logger.info("Rolling restart complete")
+
+def log_status(workers):
+    running = sum(1 for w in workers if w.status == 'running')
+    logger.info("Workers: %d/%d running" % (running, len(workers)))
+    for worker in workers:
+        logger.info("  %s" % worker.describe())
+
+async def report_status(workers):
+    while True:
+        await asyncio.sleep(config.STATUS_INTERVAL)
+        log_status(workers)
+
+async def main():
+    """Supervise the workers until SIGTERM/SIGINT, then stop them gracefully"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    workers = [Worker(i, config.WORKER_COUNT) for i in range(config.WORKER_COUNT)]
+    rolling = None
+
+    def start_rolling_restart():
+        nonlocal rolling
+        if rolling is None or rolling.done():
+            rolling = asyncio.create_task(rolling_restart(workers))
+        else:
+            logger.warning("Rolling restart already in progress")
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
+    loop.add_signal_handler(signal.SIGHUP, start_rolling_restart)
+    loop.add_signal_handler(signal.SIGUSR1, log_status, workers)
+
+    async with aiohttp.ClientSession() as session:
+        supervisors = [asyncio.create_task(worker.supervise(session)) for worker in workers]
+        status = asyncio.create_task(report_status(workers))
+        await stop_event.wait()
+
+        logger.info("Watchdog stopping - shutting down %d worker(s)" % len(workers))
+        for task in supervisors + [status] + ([rolling] if rolling else []):
+            task.cancel()
+        await asyncio.gather(*supervisors, status, return_exceptions=True)
+        await asyncio.gather(*(worker.shutdown() for worker in workers))
 
 if __name__ == '__main__':
     logger.info("=" * 70)
-    logger.info("WATCHDOG STARTED - Monitoring bot process")
+    logger.info("WATCHDOG STARTED - Monitoring %d bot process(es)" % config.WORKER_COUNT)
     logger.info("Max restarts per hour: %d" % config.MAX_RESTARTS_PER_HOUR)
     logger.info("Initial restart wait: %ds" % config.INITIAL_RESTART_WAIT)
     logger.info("Max restart wait: %ds" % config.MAX_RESTART_WAIT)
+    logger.info("Warm standby: %s" % ('on' if config.WARM_STANDBY else 'off'))
+    logger.info("Health checks: every %ds, restart after %d failures" % (
+        config.HEALTH_CHECK_INTERVAL, config.HEALTH_CHECK_FAILURES
+    ))
     logger.info("=" * 70)
-    run_bot()
+    asyncio.run(main())
@@ -22,8 +22,43 @@ VERBOSE_LOGGING = True
 # Log file location
 LOG_FILE = 'watchdog.log'
 
+# Command used to start the bot
+BOT_COMMAND = ['python3', 'bot.py']
+
+# Number of bot worker processes. With more than one, use webhook mode:
+# workers share the port (SO_REUSEPORT) and only worker 0 registers the
+# webhook. In polling mode the extra workers wait as standbys.
+WORKER_COUNT = 1
+
+# How often to log the status of all workers (seconds)
+STATUS_INTERVAL = 300
+
 # Health check interval (seconds) - how often to check if bot is responsive
-HEALTH_CHECK_INTERVAL = 60
+HEALTH_CHECK_INTERVAL = 15
 
-# Timeout for health check (seconds)
+# Timeout for health check (seconds) - HTTP probe timeout, and how much
+# older than HEARTBEAT_INTERVAL the heartbeat file may get
 HEALTH_CHECK_TIMEOUT = 10
+
+# Consecutive failed health checks before the bot is restarted
+HEALTH_CHECK_FAILURES = 3
+
+# Grace period after start (seconds) before failed checks count
+# (imports, migrations, waiting as a polling standby)
+HEALTH_CHECK_START_PERIOD = 120
+
+# Heartbeat file the bot touches every HEARTBEAT_INTERVAL seconds
+HEARTBEAT_FILE = 'bot.heartbeat'
+HEARTBEAT_INTERVAL = 5
+
+# Optional HTTP liveness probe, e.g. 'http://127.0.0.1:8000/healthz'
+# (webhook mode); None to rely on the heartbeat file only. Only used with
+# a single worker, since workers share the port.
+HEALTH_CHECK_URL = None
+
+# Time allowed for a graceful shutdown after SIGTERM before SIGKILL (seconds)
+STOP_GRACE_PERIOD = 30
+
+# Keep a warm standby process per worker (imports done, database pool
+# open) that takes over as soon as the active process dies
+WARM_STANDBY = True
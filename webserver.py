@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Embedded aiohttp server for RefLoop Bot
+
+Serves the Telegram webhook and two cheap probe endpoints:
+
+    POST /webhook   updates pushed by Telegram (secret token checked)
+    GET  /healthz   liveness: the event loop is answering requests
+    GET  /readyz    readiness: application running, database pool
+                    answering and event loop lag below READY_MAX_LOOP_LAG,
+                    plus pool and outbound queue metrics
+
+Probes never touch Telegram, so they are safe for keep-alive pingers
+and supervisors to hit often.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from aiohttp import web
+from telegram import Update
+
+import database as db
+import database_async as adb
+from outbound import outbound
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = '/webhook'
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a short sleep"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.monotonic() - started - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+
+class WebServer:
+    """aiohttp server feeding webhook updates into a PTB Application"""
+
+    def __init__(self, application, secret_token: str = None):
+        self.application = application
+        self.secret_token = secret_token
+        self.max_loop_lag = float(os.getenv('READY_MAX_LOOP_LAG', '1'))
+        self.db_timeout = float(os.getenv('READY_DB_TIMEOUT', '2'))
+        self.loop_lag = LoopLagMonitor()
+        self.started_at = time.monotonic()
+        self.last_update_at = None
+        self.accepting = True
+        self._runner = None
+
+    async def start(self, host: str, port: int, reuse_port: bool = False):
+        """Start listening on host:port (shared with other workers if reuse_port)"""
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self._webhook)
+        app.router.add_get('/healthz', self._healthz)
+        app.router.add_get('/readyz', self._readyz)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port, reuse_port=reuse_port or None).start()
+        self.loop_lag.start()
+        logger.info("HTTP server listening on %s:%d" % (host, port))
+
+    def stop_intake(self):
+        """Refuse further webhook updates; probes keep answering"""
+        self.accepting = False
+
+    async def stop(self):
+        """Stop listening and close open connections"""
+        await self.loop_lag.stop()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _webhook(self, request):
+        if self.secret_token and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret_token:
+            return web.Response(status=403)
+        if not self.accepting:
+            # Shutting down: Telegram retries, reaching the next instance
+            return web.Response(status=503)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            logger.warning("Rejected malformed webhook payload: %s" % str(e))
+            return web.Response(status=400)
+        self.last_update_at = time.monotonic()
+        # Handlers run on the application's own tasks; reply to Telegram now
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def _healthz(self, request):
+        return web.json_response({
+            'status': 'ok',
+            'uptime': round(time.monotonic() - self.started_at, 1),
+        })
+
+    async def _readyz(self, request):
+        checks = {}
+        db_error = await adb.check_database(self.db_timeout)
+        checks['database'] = db_error or 'ok'
+        lag = self.loop_lag.lag
+        checks['loop_lag'] = 'ok' if lag <= self.max_loop_lag else "%.3fs" % lag
+        if not self.accepting:
+            checks['application'] = 'draining'
+        else:
+            checks['application'] = 'ok' if self.application.running else 'not running'
+        ready = all(value == 'ok' for value in checks.values())
+        return web.json_response({
+            'status': 'ready' if ready else 'not ready',
+            'checks': checks,
+            'loop_lag_ms': round(1000 * lag, 1),
+            'pool': adb.get_pool_stats(),
+            'sync_pool': db.get_pool_stats(),
+            'outbound': outbound.stats(),
+        }, status=200 if ready else 503)